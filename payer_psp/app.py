@@ -1,10 +1,18 @@
+import hashlib
 import logging
 import os
+import queue
+import threading
 import xml.etree.ElementTree as ET
+import orjson
 import requests
+from cachetools import TTLCache
 from flask import Flask, jsonify, request, Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from db.db import init_db, seed_sample_users, User
+from service_util import ORJSONProvider
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,7 +25,9 @@ logger = logging.getLogger(__name__)
 werkzeug_logger = logging.getLogger('werkzeug')
 werkzeug_logger.setLevel(logging.INFO)
 
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 
 # Request logging middleware
@@ -44,6 +54,21 @@ def log_response(response):
     return response
 NS = "http://npci.org/upi/schema/"
 NPCI_URL = os.environ.get("NPCI_URL", "http://npci:5000")
+_ORCH_URL = os.environ.get("ORCHESTRATOR_URL", "http://orchestrator:6000")
+_LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-3.5-turbo")
+_LLM_API_KEY = os.environ.get("OPENAI_API_KEY")
+_LLM_BASE_URL = os.environ.get("LLM_BASE_URL")
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_ORCH_SESSION = requests.Session()
+_ORCH_SESSION.mount(
+    "http://",
+    HTTPAdapter(max_retries=Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"POST"}),
+    )),
+)
 _session_factory = None
 
 
@@ -132,7 +157,7 @@ def reqpay() -> tuple[Response | dict, int]:
         amount = float(amt_el.get("value") or 0)
         # Minimum transaction amount validation (1 rs)
         if amount < 1.0:
-            logger.info(f"[payer_psp] Validation failed: Amount {amount} below minimum for {payer_vpa}")
+            logger.info("[payer_psp] Validation failed: Amount %s below minimum for %s", amount, payer_vpa)
             return jsonify(error="INVALID_AMOUNT", details="Transaction amount must be at least 1 rs"), 400
         
         # Extract PIN from Creds
@@ -146,18 +171,18 @@ def reqpay() -> tuple[Response | dict, int]:
                     provided_pin = data.text.strip()
         
         if not provided_pin:
-            logger.info(f"[payer_psp] Validation failed: PIN not provided for {payer_vpa}")
+            logger.info("[payer_psp] Validation failed: PIN not provided for %s", payer_vpa)
             return jsonify(error="MISSING_PIN", details="UPI PIN is required"), 400
 
         # Validate PIN against DB
         with _session_factory() as session:
             user = session.query(User).filter_by(vpa=payer_vpa).one_or_none()
             if not user:
-                logger.info(f"[payer_psp] Validation failed: User not found for VPA {payer_vpa}")
+                logger.info("[payer_psp] Validation failed: User not found for VPA %s", payer_vpa)
                 return jsonify(error="PAYER_NOT_FOUND"), 400
             
             if user.pin != provided_pin:
-                logger.info(f"[payer_psp] Validation failed: Incorrect PIN for {payer_vpa}")
+                logger.info("[payer_psp] Validation failed: Incorrect PIN for %s", payer_vpa)
                 return jsonify(error="INVALID_PIN", details="The entered UPI PIN is incorrect"), 400
 
         # Log Payer.code before forwarding for debugging
@@ -165,22 +190,22 @@ def reqpay() -> tuple[Response | dict, int]:
         payees_elem = root.find(q("Payees"))
         payee_elem = payees_elem.find(f"{{{NS}}}Payee") if payees_elem is not None else None
         payee_code = payee_elem.get("code") if payee_elem is not None else None
-        logger.info(f"[payer_psp] Validated ReqPay for {payer_vpa} | Amount: {amount} | PIN: OK | Payer.code={payer_code} | Payee.code={payee_code}")
+        logger.info("[payer_psp] Validated ReqPay for %s | Amount: %s | PIN: OK | Payer.code=%s | Payee.code=%s", payer_vpa, amount, payer_code, payee_code)
         # New validation: block payments to Payees with code 1111 (demo restriction)
         if payee_code == "1111":
-            logger.info(f"[payer_psp] Blocked payment to Payee.code=1111 for demo purposes")
+            logger.info("[payer_psp] Blocked payment to Payee.code=1111 for demo purposes")
             return jsonify(error="FAIL", details="Code Blocked for Demo"), 400
         # Mandatory DeviceBinding tag validation
         device_elem = root.find(q("Device"))
         if device_elem is None:
-            logger.info(f"[payer_psp] Validation failed: missing Device element for {payer_vpa}")
+            logger.info("[payer_psp] Validation failed: missing Device element for %s", payer_vpa)
             return jsonify(error="MISSING_DEVICEBINDING", details="Device tag is required"), 400
         if device_elem.get("name") != "devicebinding":
-            logger.info(f"[payer_psp] Validation failed: Device name incorrect for {payer_vpa}")
+            logger.info("[payer_psp] Validation failed: Device name incorrect for %s", payer_vpa)
             return jsonify(error="INVALID_DEVICEBINDING", details="Device name must be 'devicebinding'"), 400
         device_value = device_elem.get("value")
         if device_value not in {"01", "02", "03"}:
-            logger.info(f"[payer_psp] Validation failed: Device value {device_value} invalid for {payer_vpa}")
+            logger.info("[payer_psp] Validation failed: Device value %s invalid for %s", device_value, payer_vpa)
             return jsonify(error="INVALID_DEVICEBINDING", details="Device value must be one of '01','02','03'"), 400
         
         # Forward the ORIGINAL XML to preserve all attributes exactly as received
@@ -188,12 +213,12 @@ def reqpay() -> tuple[Response | dict, int]:
         forward_xml = request.data
         
         # Log first 500 chars of forwarded XML for debugging
-        logger.info(f"[payer_psp] Forwarding ORIGINAL XML to NPCI (first 500 chars): {forward_xml[:500].decode('utf-8', errors='replace')}")
+        logger.info("[payer_psp] Forwarding ORIGINAL XML to NPCI (first 500 chars): %s", forward_xml[:500].decode('utf-8', errors='replace'))
         
     except ET.ParseError as e:
         return jsonify(error=f"Invalid XML: {e}"), 400
     except Exception as e:
-        logger.error(f"[payer_psp] Error processing ReqPay: {e}")
+        logger.error("[payer_psp] Error processing ReqPay: %s", e)
         return jsonify(error=f"Internal error: {e}"), 500
     
     # Forward XML to NPCI
@@ -245,33 +270,79 @@ def resppay() -> tuple[dict, int]:
 _payer_psp_agent = None
 
 
+_LLM_CACHE: dict[tuple[str, str | None, str], object] = {}
+
+
+def _make_llm(model: str, api_key: str | None, base_url: str | None):
+    """Return a process-wide LLM for this config, keyed by a digest of the API key."""
+    key = (model, base_url, hashlib.sha256((api_key or "").encode()).hexdigest())
+    llm = _LLM_CACHE.get(key)
+    if llm is None:
+        from llm import LLM
+
+        llm = _LLM_CACHE[key] = LLM(model=model, api_key=api_key, base_url=base_url)
+    return llm
+
+
 def _get_payer_psp_agent():
     """Get Payer PSP Agent instance (lazy initialization)."""
     global _payer_psp_agent
     if _payer_psp_agent is None:
         try:
             from agents import PayerPSPAgent
-            from llm import LLM
 
             try:
-                llm = LLM(
-                    model=os.environ.get("LLM_MODEL", "gpt-3.5-turbo"),
-                    api_key=os.environ.get("OPENAI_API_KEY"),
-                    base_url=os.environ.get("LLM_BASE_URL"),
-                )
+                llm = _make_llm(_LLM_MODEL, _LLM_API_KEY, _LLM_BASE_URL)
                 logger.info("[Payer PSP Agent] LLM initialized")
             except Exception as e:
-                logger.warning(f"[Payer PSP Agent] LLM initialization failed: {e}, using fallback mode")
+                logger.warning("[Payer PSP Agent] LLM initialization failed: %s, using fallback mode", e)
                 llm = None
 
             _payer_psp_agent = PayerPSPAgent(llm_instance=llm)
-            logger.info(f"[Payer PSP Agent] Initialized: {_payer_psp_agent.agent_name}")
+            logger.info("[Payer PSP Agent] Initialized: %s", _payer_psp_agent.agent_name)
         except ImportError as e:
-            logger.error(f"[Payer PSP Agent] Failed to import agent infrastructure: {e}")
+            logger.error("[Payer PSP Agent] Failed to import agent infrastructure: %s", e)
             _payer_psp_agent = None
     return _payer_psp_agent
 
 
+_NOTIFY_Q: "queue.Queue[tuple[bytes, float]]" = queue.Queue(maxsize=1024)
+
+
+def _notify_drainer() -> None:
+    """Post queued status updates to the orchestrator, retrying on the primary URL only."""
+    while True:
+        body, timeout = _NOTIFY_Q.get()
+        try:
+            _ORCH_SESSION.post(
+                f"{_ORCH_URL}/api/orchestrator/status",
+                data=body,
+                headers=_JSON_HEADERS,
+                timeout=timeout,
+            )
+        except Exception as e:
+            logger.warning("Failed to update orchestrator: %s", e)
+        finally:
+            _NOTIFY_Q.task_done()
+
+
+def _notify_orchestrator(change_id: str, agent_id: str, status: str, details, timeout: float = 2) -> None:
+    """Hand a status update to the drainer without blocking the request."""
+    body = orjson.dumps({
+        "change_id": change_id,
+        "agent_id": agent_id,
+        "status": status,
+        "details": details,
+    })
+    try:
+        _NOTIFY_Q.put_nowait((body, timeout))
+    except queue.Full:
+        logger.warning("Orchestrator notify queue full, dropping status update")
+
+
+threading.Thread(target=_notify_drainer, name="orch-notify", daemon=True).start()
+
+
 @app.post("/api/agent/manifest")
 def receive_manifest_endpoint():
     """Receive manifest via A2A protocol."""
@@ -293,71 +364,51 @@ def receive_manifest_endpoint():
             return jsonify(error="Missing manifest in payload"), 400
 
         manifest = ChangeManifest.from_dict(manifest_dict)
+        desc_snip = (manifest.description or "")[:100]
 
         result = agent.receive_manifest(manifest)
 
-        try:
-            import requests as req
-            orchestrator_url = os.environ.get("ORCHESTRATOR_URL", "http://orchestrator:6000")
-            try:
-                req.post(
-                    f"{orchestrator_url}/api/orchestrator/status",
-                    json={
-                        "change_id": manifest.change_id,
-                        "agent_id": agent.agent_id,
-                        "status": "RECEIVED",
-                        "details": f"Received manifest: '{manifest.description[:100]}'"
-                    },
-                    timeout=2,
-                )
-            except Exception:
-                req.post(
-                    "http://localhost:9991/api/orchestrator/status",
-                    json={
-                        "change_id": manifest.change_id,
-                        "agent_id": agent.agent_id,
-                        "status": "RECEIVED",
-                        "details": f"Received manifest: '{manifest.description[:100]}'"
-                    },
-                    timeout=2,
-                )
-        except Exception as e:
-            logger.warning(f"Failed to update orchestrator: {e}")
+        # The drainer posts RECEIVED while process_manifest runs below, so the
+        # orchestrator round trip overlaps processing without an async view.
+        _notify_orchestrator(
+            manifest.change_id, agent.agent_id, "RECEIVED", f"Received manifest: '{desc_snip}'"
+        )
 
         try:
             process_result = agent.process_manifest(manifest)
 
             try:
-                import requests as req
-                orchestrator_url = os.environ.get("ORCHESTRATOR_URL", "http://orchestrator:6000")
                 final_message = process_result.get("message", "")
                 if not final_message:
                     applied_count = len(process_result.get("applied_changes", []))
                     final_message = f"Processing complete. {applied_count} file(s) updated successfully."
 
-                req.post(
-                    f"{orchestrator_url}/api/orchestrator/status",
-                    json={
-                        "change_id": manifest.change_id,
-                        "agent_id": agent.agent_id,
-                        "status": process_result.get("status", "RECEIVED"),
-                        "details": {"message": final_message, **process_result},
-                    },
+                _notify_orchestrator(
+                    manifest.change_id,
+                    agent.agent_id,
+                    process_result.get("status", "RECEIVED"),
+                    {"message": final_message, **process_result},
                     timeout=5,
                 )
             except Exception as e:
-                logger.warning(f"[Payer PSP Agent] Failed to update orchestrator: {e}")
+                logger.warning("[Payer PSP Agent] Failed to update orchestrator: %s", e)
 
             return jsonify(process_result), 200
         except Exception as e:
-            logger.error(f"[Payer PSP Agent] Error processing manifest: {e}")
+            logger.error("[Payer PSP Agent] Error processing manifest: %s", e)
             return jsonify({**result, "processing_error": str(e)}), 200
 
     except Exception as e:
-        logger.error(f"[Payer PSP Agent] Error receiving manifest: {e}")
+        logger.error("[Payer PSP Agent] Error receiving manifest: %s", e)
         return jsonify(error=str(e)), 500
 
 
+# Short-lived cache so a burst of pollers for the same change_id skips the history scan. Holds the
+# serialized JSON body (b"" when the change is unknown), never the agent's live status dict.
+_STATUS_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=0.25)
+_STATUS_LOCK = threading.Lock()
+
+
 @app.get("/api/agent/status/<change_id>")
 def get_agent_status(change_id: str):
     """Get agent status for a specific change."""
@@ -365,13 +416,20 @@ def get_agent_status(change_id: str):
     if not agent:
         return jsonify(error="Payer PSP Agent not available"), 503
 
-    status = agent.get_status(change_id)
-    if status:
-        return jsonify(status), 200
+    with _STATUS_LOCK:
+        body = _STATUS_CACHE.get(change_id)
+    if body is None:
+        status = agent.get_status(change_id)
+        body = orjson.dumps(status, default=app.json.default) if status else b""
+        with _STATUS_LOCK:
+            _STATUS_CACHE[change_id] = body
+    if body:
+        return app.response_class(body, mimetype="application/json"), 200
     return jsonify(error="Change not found"), 404
 
 
 if __name__ == "__main__":
     _startup()
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port)
+    from waitress import serve
+    serve(app, host="0.0.0.0", port=port, threads=int(os.environ.get("WSGI_THREADS", "16")))
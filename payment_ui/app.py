@@ -3,14 +3,22 @@ Payment UI - GPay-like interface for UPI transaction simulation
 """
 import logging
 import os
-import xml.etree.ElementTree as ET
-import xml.sax.saxutils as saxutils
-from datetime import datetime
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
 from flask import Flask, jsonify, request, send_from_directory
+import orjson
 import requests
-import xml.dom.minidom
+from requests.adapters import HTTPAdapter
+from lxml import etree
 
-import sys
+# service_util.py lives at the repo root when run locally (cd payment_ui); the image copies it next to app.py
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+from service_util import ORJSONProvider, escape_attr, xsd_path
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,7 +32,9 @@ logger = logging.getLogger(__name__)
 werkzeug_logger = logging.getLogger('werkzeug')
 werkzeug_logger.setLevel(logging.INFO)
 
+
 app = Flask(__name__, static_folder='static', static_url_path='/static')
+app.json = ORJSONProvider(app)
 
 
 # Request logging middleware
@@ -35,10 +45,11 @@ def log_request():
                 request.content_type or "N/A",
                 request.content_length or 0,
                 request.remote_addr)
-    if request.args:
+    if request.args and logger.isEnabledFor(logging.INFO):
         logger.info("    Query params: %s", dict(request.args))
-    if request.is_json:
-        logger.info("    JSON body: %s", request.get_json())
+    # Transaction bodies carry whole XML documents; only decode/log them at DEBUG
+    if request.is_json and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("    JSON body: %s", request.get_json(cache=True))
 
 
 @app.after_request
@@ -54,6 +65,53 @@ def log_response(response):
 NS = "http://npci.org/upi/schema/"
 PAYER_PSP_URL = os.environ.get("PAYER_PSP_URL", "http://localhost:5004")
 
+# Resolved Payer PSP URL and its expiry (monotonic seconds); re-resolved at most every _PSP_URL_TTL
+_PSP_URL_TTL = 60.0
+_psp_url_cache: tuple[str, float] | None = None
+
+# Keep-alive connection pool to the Payer PSP shared by both transaction handlers
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=64))
+_SESSION.headers.update({"Content-Type": "application/xml", "Connection": "keep-alive"})
+
+# Shared libxml2 parser for user-supplied XML (no entity expansion or network fetches)
+_XML_PARSER = etree.XMLParser(resolve_entities=False, no_network=True)
+# Same, but drops inter-element whitespace so pretty_print can re-indent
+_PRETTY_PARSER = etree.XMLParser(remove_blank_text=True, resolve_entities=False, no_network=True)
+
+
+def _load_reqpay_schema() -> etree.XMLSchema | None:
+    """Compile upi_pay_request.xsd once at startup; None (validation skipped) if the file is absent."""
+    path = xsd_path(__file__, "upi_pay_request.xsd")
+    if not os.path.isfile(path):
+        logger.warning("ReqPay XSD not found at %s; edited XML will not be schema-validated", path)
+        return None
+    with open(path, "rb") as f:
+        return etree.XMLSchema(etree.parse(f))
+
+
+_REQPAY_SCHEMA = _load_reqpay_schema()
+
+
+def _child_xpath(tag: str) -> etree.XPath:
+    """Compile a direct-child lookup for ``tag`` in the UPI namespace (the only one the XSD accepts)."""
+    return etree.XPath(f"./upi:{tag}", namespaces={"upi": NS})
+
+
+# Child lookups used on user-edited ReqPay XML, compiled once at import
+_XP_TXN = _child_xpath("Txn")
+_XP_HEAD = _child_xpath("Head")
+_XP_PAYER = _child_xpath("Payer")
+_XP_PAYEES = _child_xpath("Payees")
+_XP_PAYEE = _child_xpath("Payee")
+_XP_AMOUNT = _child_xpath("Amount")
+
+
+def _first(xpath: etree.XPath, elem):
+    """Return the first node matched by ``xpath`` under ``elem``, or None."""
+    hits = xpath(elem)
+    return hits[0] if hits else None
+
 # Sample contacts - in a real app, these would come from a database
 CONTACTS = [
     {"vpa": "abhishek@phonepe", "name": "Abhishek", "avatar": "👨", "bank": "PhonePe"},
@@ -74,45 +132,76 @@ PAYEE_VPA_TO_PAYER_VPA = {
     "harsh@phonepe": "harsh@paytm",
 }
 
-
-def _update_balances_on_success(payer_vpa: str, payee_vpa: str, amount: float) -> None:
-    """Update PAYER_USERS balances after a successful transaction. Payer debited, payee credited."""
-    for u in PAYER_USERS:
-        if u["vpa"] == payer_vpa:
-            u["balance"] = round(u["balance"] - amount, 2)
-        payer_vpa_for_payee = PAYEE_VPA_TO_PAYER_VPA.get(payee_vpa)
-        if payer_vpa_for_payee and u["vpa"] == payer_vpa_for_payee:
-            u["balance"] = round(u["balance"] + amount, 2)
-
-
-def _qname(tag: str) -> str:
-    """Generate qualified XML tag name with namespace."""
-    return f"{{{NS}}}{tag}"
+# VPA -> user dict (same objects as PAYER_USERS, so balance writes are visible through both)
+_PAYER_BY_VPA = {u["vpa"]: u for u in PAYER_USERS}
+
+
+# Pre-serialized read-mostly responses; the users body is rebuilt lazily after a balance change
+_CONTACTS_JSON_CACHE = orjson.dumps({"contacts": CONTACTS})
+_USERS_JSON_CACHE: bytes | None = None
+# Guards the users body rebuild and the balance writes it is built from
+_USERS_LOCK = threading.Lock()
+
+
+def _update_balances_on_success(payer_vpa: str, payee_vpa: str, amount: float) -> float:
+    """Update PAYER_USERS balances after a successful transaction. Payer debited, payee credited.
+
+    Returns the payer's balance before the debit (10000 for an unknown payer), read under the same lock.
+    """
+    global _USERS_JSON_CACHE
+    with _USERS_LOCK:
+        payer = _PAYER_BY_VPA.get(payer_vpa)
+        payer_balance = 10000
+        if payer is not None:
+            payer_balance = payer["balance"]
+            payer["balance"] = round(payer_balance - amount, 2)
+        payee_owner = _PAYER_BY_VPA.get(PAYEE_VPA_TO_PAYER_VPA.get(payee_vpa, ""))
+        if payee_owner is not None:
+            payee_owner["balance"] = round(payee_owner["balance"] + amount, 2)
+        # Invalidate only once the new balances are in place, so a rebuild can't cache the old ones
+        _USERS_JSON_CACHE = None
+    return payer_balance
+
+
+def _detect_payer_psp_url() -> str:
+    """Prefer the in-network payer_psp host when it resolves; cached so DNS is not hit per request."""
+    global _psp_url_cache
+    now = time.monotonic()
+    if _psp_url_cache is not None and _psp_url_cache[1] > now:
+        return _psp_url_cache[0]
+    url = PAYER_PSP_URL
+    try:
+        socket.gethostbyname('payer_psp')
+        url = "http://payer_psp:5004"
+    except socket.gaierror:
+        pass
+    _psp_url_cache = (url, now + _PSP_URL_TTL)
+    return url
 
 
 def prettify_xml(xml_string: str) -> str:
     """Format XML string with proper indentation."""
     try:
-        dom = xml.dom.minidom.parseString(xml_string if isinstance(xml_string, bytes) else xml_string.encode())
-        return dom.toprettyxml(indent="  ")
+        raw = xml_string if isinstance(xml_string, bytes) else xml_string.encode()
+        root = etree.fromstring(raw, _PRETTY_PARSER)
+        return etree.tostring(root, pretty_print=True, xml_declaration=True, encoding="UTF-8").decode()
     except Exception:
         return xml_string
 
 
-def _get_txn_purpose_from_reqpay(xml_str: str | bytes) -> str | None:
-    """Extract Txn.purpose from ReqPay XML (upi_pay_request.xsd). Returns None on parse error or if missing."""
-    try:
-        raw = xml_str.encode() if isinstance(xml_str, str) else xml_str
-        root = ET.fromstring(raw)
-        txn = root.find(f".//{{{NS}}}Txn")
-        return (txn.get("purpose") or "").strip() or None if txn is not None else None
-    except Exception:
-        return None
+def _pretty_requested() -> bool:
+    """True when the client asked for re-indented XML via ?pretty=1; the built templates are already indented."""
+    return request.args.get("pretty", "").lower() in ("1", "true")
 
 
-def build_reqpay_debit_xml(txn_id: str, msg_id: str, payer_vpa: str, amount: float, payer_code: str = "0000", purpose: str | None = "PAY") -> str:
+def _now_ts() -> str:
+    """Current UTC time in the Head/Txn ts format; compute once per request and share across builders."""
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def build_reqpay_debit_xml(txn_id: str, msg_id: str, payer_vpa: str, amount: float, payer_code: str = "0000", purpose: str | None = "PAY", ts: str | None = None) -> str:
     """Build ReqPay DEBIT XML (NPCI → Remitter Bank). Per upi_pay_request.xsd Txn.purpose is optional."""
-    ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    ts = ts or _now_ts()
     purpose_attr = f' purpose="{purpose}"' if purpose else ""
     return f'''<?xml version="1.0" encoding="UTF-8"?>
 <ns:ReqPay xmlns:ns="{NS}">
@@ -124,18 +213,11 @@ def build_reqpay_debit_xml(txn_id: str, msg_id: str, payer_vpa: str, amount: flo
 </ns:ReqPay>'''
 
 
-def _escape_attr(s: str) -> str:
-    """Escape string for use in an XML attribute value (per XML 1.0)."""
-    if not s:
-        return s
-    return saxutils.escape(s, {"'": "&apos;", '"': "&quot;"})
-
-
-def build_resppay_debit_xml(txn_id: str, msg_id: str, result: str = "SUCCESS", bal_amt: float = None, err_code: str | None = None) -> str:
+def build_resppay_debit_xml(txn_id: str, msg_id: str, result: str = "SUCCESS", bal_amt: float = None, err_code: str | None = None, ts: str | None = None) -> str:
     """Build RespPay DEBIT XML (Remitter Bank → NPCI). Per common/schemas/upi_resppay_response.xsd."""
-    ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    ts = ts or _now_ts()
     bal_ref = f'\n    <ns:Ref balAmt="{bal_amt:.2f}"/>' if bal_amt is not None else ''
-    err_attr = f' errCode="{_escape_attr(err_code)}"' if err_code else ''
+    err_attr = f' errCode="{escape_attr(err_code)}"' if err_code else ''
     return f'''<?xml version="1.0" encoding="UTF-8"?>
 <ns:RespPay xmlns:ns="{NS}">
   <ns:Head ver="2.0" ts="{ts}" orgId="REM_BANK" msgId="resppay-debit-{msg_id}" prodType="UPI"/>
@@ -145,30 +227,31 @@ def build_resppay_debit_xml(txn_id: str, msg_id: str, result: str = "SUCCESS", b
 </ns:RespPay>'''
 
 
-def build_reqpay_credit_xml(txn_id: str, msg_id: str, payer_vpa: str, payee_vpa: str, amount: float, payer_code: str = "0000", payee_code: str = "0000", purpose: str | None = "PAY") -> str:
+def build_reqpay_credit_xml(txn_id: str, msg_id: str, payer_vpa: str, payee_vpa: str, amount: float, payer_code: str = "0000", payee_code: str = "0000", purpose: str | None = "PAY", ts: str | None = None) -> str:
     """Build ReqPay CREDIT XML (NPCI → Beneficiary Bank). Per upi_pay_request.xsd Txn.purpose is optional."""
-    ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    ts = ts or _now_ts()
     purpose_attr = f' purpose="{purpose}"' if purpose else ""
+    amt = f"{amount:.2f}"
     return f'''<?xml version="1.0" encoding="UTF-8"?>
 <ns:ReqPay xmlns:ns="{NS}">
   <ns:Head ver="2.0" ts="{ts}" orgId="NPCI" msgId="CREDIT-{msg_id}" prodType="UPI"/>
   <ns:Txn id="{txn_id}" note="UPI Payment" type="CREDIT" ts="{ts}"{purpose_attr}/>
   <ns:Payer addr="{payer_vpa}" name="Payer Name" seqNum="1" type="PERSON" code="{payer_code}">
-    <ns:Amount value="{amount:.2f}" curr="INR"/>
+    <ns:Amount value="{amt}" curr="INR"/>
   </ns:Payer>
   <ns:Payees>
     <ns:Payee addr="{payee_vpa}" name="Payee Name" seqNum="1" type="PERSON" code="{payee_code}">
-      <ns:Amount value="{amount:.2f}" curr="INR"/>
+      <ns:Amount value="{amt}" curr="INR"/>
     </ns:Payee>
   </ns:Payees>
 </ns:ReqPay>'''
 
 
-def build_resppay_credit_xml(txn_id: str, msg_id: str, result: str = "SUCCESS", bal_amt: float = None, err_code: str | None = None) -> str:
+def build_resppay_credit_xml(txn_id: str, msg_id: str, result: str = "SUCCESS", bal_amt: float = None, err_code: str | None = None, ts: str | None = None) -> str:
     """Build RespPay CREDIT XML (Beneficiary Bank → NPCI). Per common/schemas/upi_resppay_response.xsd."""
-    ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    ts = ts or _now_ts()
     bal_ref = f'\n    <ns:Ref balAmt="{bal_amt:.2f}"/>' if bal_amt is not None else ''
-    err_attr = f' errCode="{_escape_attr(err_code)}"' if err_code else ''
+    err_attr = f' errCode="{escape_attr(err_code)}"' if err_code else ''
     return f'''<?xml version="1.0" encoding="UTF-8"?>
 <ns:RespPay xmlns:ns="{NS}">
   <ns:Head ver="2.0" ts="{ts}" orgId="BENE_BANK" msgId="resppay-credit-{msg_id}" prodType="UPI"/>
@@ -180,66 +263,81 @@ def build_resppay_credit_xml(txn_id: str, msg_id: str, result: str = "SUCCESS",
 
 def build_reqpay_xml(payer_vpa: str, payee_vpa: str, amount: float, pin: str, purpose: str | None = "PAY") -> tuple[bytes, str, str]:
     """Build ReqPay XML message for UPI payment. Returns (xml_bytes, txn_id, msg_id). Per upi_pay_request.xsd Txn.purpose is optional."""
-    ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    txn_id = f"TXN{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')[:-3]}"
-    msg_id = f"MSG{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')[:-3]}"
-    
-    root = ET.Element(_qname("ReqPay"))
-    
-    # Head
-    head = ET.SubElement(root, _qname("Head"))
-    head.set("ver", "2.0")
-    head.set("ts", ts)
-    head.set("orgId", "PAYER_PSP")
-    head.set("msgId", msg_id)
-    head.set("prodType", "UPI")
-    
-    # Txn (purpose is optional in upi_pay_request.xsd TxnType)
-    txn = ET.SubElement(root, _qname("Txn"))
-    txn.set("id", txn_id)
-    txn.set("note", "UPI Payment")
-    txn.set("type", "PAY")
-    txn.set("ts", ts)
-    if purpose:
-        txn.set("purpose", purpose)
-    
-    # Payer
-    payer = ET.SubElement(root, _qname("Payer"))
-    payer.set("addr", payer_vpa)
-    payer.set("name", "Payer Name")
-    payer.set("seqNum", "1")
-    payer.set("type", "PERSON")
-    payer.set("code", "0000")
-    
-    # Payer Credentials (PIN) - MUST COME BEFORE AMOUNT per XSD schema
-    creds = ET.SubElement(payer, _qname("Creds"))
-    cred = ET.SubElement(creds, _qname("Cred"))
-    cred.set("type", "PIN")
-    cred_data = ET.SubElement(cred, _qname("Data"))
-    cred_data.text = pin
-    
-    # Payer Amount - MUST COME AFTER CREDS per XSD schema
-    payer_amount = ET.SubElement(payer, _qname("Amount"))
-    payer_amount.set("value", f"{amount:.2f}")
-    payer_amount.set("curr", "INR")
-    
-    # Payees
-    payees = ET.SubElement(root, _qname("Payees"))
-    payee = ET.SubElement(payees, _qname("Payee"))
-    payee.set("addr", payee_vpa)
-    payee.set("name", "Payee Name")
-    payee.set("seqNum", "1")
-    payee.set("type", "PERSON")
-    payee.set("code", "0000")
-    
-    # Payee Amount
-    payee_amount = ET.SubElement(payee, _qname("Amount"))
-    payee_amount.set("value", f"{amount:.2f}")
-    payee_amount.set("curr", "INR")
-    
-    xml_str = ET.tostring(root, encoding="unicode", method="xml")
-    full_xml = '<?xml version="1.0" encoding="UTF-8"?>\n' + xml_str
-    return full_xml.encode("utf-8"), txn_id, msg_id
+    now = datetime.utcnow()
+    ts = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    stamp = now.strftime('%Y%m%d%H%M%S%f')[:-3]
+    txn_id = f"TXN{stamp}"
+    msg_id = f"MSG{stamp}"
+    purpose_attr = f' purpose="{escape_attr(purpose)}"' if purpose else ""
+    amt = f"{amount:.2f}"
+    # Payer Creds (PIN) MUST come before Amount per XSD schema
+    xml_str = f'''<?xml version="1.0" encoding="UTF-8"?>
+<ns:ReqPay xmlns:ns="{NS}">
+  <ns:Head ver="2.0" ts="{ts}" orgId="PAYER_PSP" msgId="{msg_id}" prodType="UPI"/>
+  <ns:Txn id="{txn_id}" note="UPI Payment" type="PAY" ts="{ts}"{purpose_attr}/>
+  <ns:Payer addr="{escape_attr(payer_vpa)}" name="Payer Name" seqNum="1" type="PERSON" code="0000">
+    <ns:Creds>
+      <ns:Cred type="PIN">
+        <ns:Data>{escape_attr(pin)}</ns:Data>
+      </ns:Cred>
+    </ns:Creds>
+    <ns:Amount value="{amt}" curr="INR"/>
+  </ns:Payer>
+  <ns:Payees>
+    <ns:Payee addr="{escape_attr(payee_vpa)}" name="Payee Name" seqNum="1" type="PERSON" code="0000">
+      <ns:Amount value="{amt}" curr="INR"/>
+    </ns:Payee>
+  </ns:Payees>
+</ns:ReqPay>'''
+    return xml_str.encode("utf-8"), txn_id, msg_id
+
+
+def _add_settlement_steps(add_step, txn_id: str, msg_id: str, payer_vpa: str, payee_vpa: str, amount: float, payer_balance: float, ts: str, payer_code: str = "0000", payee_code: str = "0000", purpose: str | None = "PAY") -> None:
+    """Append the simulated NPCI ↔ bank DEBIT/CREDIT legs (steps 3-6) that follow a 202 from the Payer PSP.
+
+    The Payer PSP accepts the ReqPay in a single round trip and NPCI drives the bank hops itself,
+    so the whole downstream timeline is produced here in one call rather than per handler.
+    """
+    # ReqPay DEBIT (preserve purpose from the ReqPay per upi_pay_request.xsd)
+    reqpay_debit = build_reqpay_debit_xml(txn_id, msg_id, payer_vpa, amount, payer_code=payer_code, purpose=purpose, ts=ts)
+    add_step(
+        "3. ReqPay DEBIT (NPCI → Remitter Bank)",
+        "success",
+        f"NPCI sent DEBIT request to debit ₹{amount:.2f} from {payer_vpa}",
+        xml_data=reqpay_debit,
+        step_type="reqpay_debit"
+    )
+
+    # RespPay DEBIT
+    estimated_balance = payer_balance - amount
+    resppay_debit = build_resppay_debit_xml(txn_id, msg_id, "SUCCESS", estimated_balance, ts=ts)
+    add_step(
+        "4. RespPay DEBIT (Remitter Bank → NPCI)",
+        "success",
+        f"Remitter Bank confirmed debit. Remaining balance: ₹{estimated_balance:.2f}",
+        xml_data=resppay_debit,
+        step_type="resppay_debit"
+    )
+
+    # ReqPay CREDIT (same purpose as DEBIT)
+    reqpay_credit = build_reqpay_credit_xml(txn_id, msg_id, payer_vpa, payee_vpa, amount, payer_code=payer_code, payee_code=payee_code, purpose=purpose, ts=ts)
+    add_step(
+        "5. ReqPay CREDIT (NPCI → Beneficiary Bank)",
+        "success",
+        f"NPCI sent CREDIT request to credit ₹{amount:.2f} to {payee_vpa}",
+        xml_data=reqpay_credit,
+        step_type="reqpay_credit"
+    )
+
+    # RespPay CREDIT
+    resppay_credit = build_resppay_credit_xml(txn_id, msg_id, "SUCCESS", amount + 1000, ts=ts)  # Simulated new balance
+    add_step(
+        "6. RespPay CREDIT (Beneficiary Bank → NPCI)",
+        "success",
+        f"Beneficiary Bank confirmed credit to {payee_vpa}",
+        xml_data=resppay_credit,
+        step_type="resppay_credit"
+    )
 
 
 @app.route("/")
@@ -257,15 +355,22 @@ def health():
 @app.route("/api/contacts", methods=["GET"])
 def get_contacts():
     """Get list of payee contacts."""
-    return jsonify(contacts=CONTACTS), 200
+    return app.response_class(_CONTACTS_JSON_CACHE, mimetype="application/json"), 200
 
 
 @app.route("/api/users", methods=["GET"])
 def get_users():
     """Get list of payer users (for login/selection)."""
-    # Don't send PINs to frontend
-    users = [{"vpa": u["vpa"], "name": u["name"], "balance": u["balance"]} for u in PAYER_USERS]
-    return jsonify(users=users), 200
+    global _USERS_JSON_CACHE
+    body = _USERS_JSON_CACHE
+    if body is None:
+        with _USERS_LOCK:
+            body = _USERS_JSON_CACHE
+            if body is None:
+                # Don't send PINs to frontend
+                users = [{"vpa": u["vpa"], "name": u["name"], "balance": u["balance"]} for u in PAYER_USERS]
+                body = _USERS_JSON_CACHE = orjson.dumps({"users": users})
+    return app.response_class(body, mimetype="application/json"), 200
 
 
 @app.route("/api/preview-reqpay", methods=["POST"])
@@ -282,13 +387,15 @@ def preview_reqpay():
             return jsonify(success=False, error="Missing required fields"), 400
         
         # Validate payer exists
-        payer = next((u for u in PAYER_USERS if u["vpa"] == payer_vpa), None)
+        payer = _PAYER_BY_VPA.get(payer_vpa)
         if not payer:
             return jsonify(success=False, error="Invalid payer VPA"), 400
         
         # Build the ReqPay XML
         xml_body, txn_id, msg_id = build_reqpay_xml(payer_vpa, payee_vpa, amount, pin)
-        pretty_xml = prettify_xml(xml_body.decode('utf-8'))
+        pretty_xml = xml_body.decode('utf-8')
+        if _pretty_requested():
+            pretty_xml = prettify_xml(pretty_xml)
         
         logger.info(f"Generated ReqPay preview: {payer_vpa} -> {payee_vpa}, Amount: {amount}, TxnId: {txn_id}")
         
@@ -314,13 +421,14 @@ def send_edited_reqpay():
     """Send edited ReqPay XML to Payer PSP."""
     steps = []
     start_time = datetime.utcnow()
+    start_perf = time.perf_counter_ns()
     
     def add_step(title, status, description, xml_data=None, duration_ms=None, step_type=None):
         step = {
             "title": title,
             "status": status,
             "description": description,
-            "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            "timestamp": (start_time + timedelta(microseconds=(time.perf_counter_ns() - start_perf) // 1000)).isoformat(sep=" ", timespec="milliseconds"),
         }
         if xml_data:
             step["xml"] = xml_data
@@ -340,21 +448,22 @@ def send_edited_reqpay():
         
         # Parse the edited XML to extract transaction details
         try:
-            root = ET.fromstring(edited_xml)
-            # Extract namespace
-            ns_match = edited_xml.split('xmlns:ns="')[1].split('"')[0] if 'xmlns:ns="' in edited_xml else NS
-            ns_prefix = f"{{{ns_match}}}"
-            
+            root = etree.fromstring(edited_xml.encode("utf-8"), _XML_PARSER)
+            # Same schema NPCI enforces, checked in C before any field extraction
+            if _REQPAY_SCHEMA is not None and not _REQPAY_SCHEMA.validate(root):
+                return jsonify(success=False, error=f"Invalid XML: {_REQPAY_SCHEMA.error_log.last_error}"), 400
             # Extract transaction ID and message ID from XML
-            txn_elem = root.find(f"{ns_prefix}Txn")
-            head_elem = root.find(f"{ns_prefix}Head")
-            payer_elem = root.find(f"{ns_prefix}Payer")
-            payees_elem = root.find(f"{ns_prefix}Payees")
+            txn_elem = _first(_XP_TXN, root)
+            head_elem = _first(_XP_HEAD, root)
+            payer_elem = _first(_XP_PAYER, root)
+            payees_elem = _first(_XP_PAYEES, root)
             
             if txn_elem is None or head_elem is None:
                 return jsonify(success=False, error="Invalid XML structure"), 400
             
             txn_id = txn_elem.get("id")
+            # Reuse this parse for the DEBIT/CREDIT purpose instead of re-parsing edited_xml per step
+            purpose = (txn_elem.get("purpose") or "").strip() or "PAY"
             msg_id = head_elem.get("msgId")
             payer_vpa = payer_elem.get("addr") if payer_elem is not None else metadata.get("payer_vpa")
             
@@ -362,7 +471,7 @@ def send_edited_reqpay():
             payee_vpa = metadata.get("payee_vpa")
             payee_code = "0000"  # Default
             if payees_elem is not None:
-                payee_elem = payees_elem.find(f"{ns_prefix}Payee")
+                payee_elem = _first(_XP_PAYEE, payees_elem)
                 if payee_elem is not None:
                     payee_vpa = payee_elem.get("addr")
                     payee_code = payee_elem.get("code", "0000")
@@ -375,7 +484,7 @@ def send_edited_reqpay():
             # Extract amount
             amount = metadata.get("amount", 0)
             if payer_elem is not None:
-                amt_elem = payer_elem.find(f"{ns_prefix}Amount")
+                amt_elem = _first(_XP_AMOUNT, payer_elem)
                 if amt_elem is not None:
                     amount = float(amt_elem.get("value", amount))
             
@@ -402,34 +511,24 @@ def send_edited_reqpay():
             step_type="reqpay"
         )
         
-        # Detect PSP URL
-        payer_psp_url = PAYER_PSP_URL
-        try:
-            import socket
-            socket.gethostbyname('payer_psp')
-            payer_psp_url = "http://payer_psp:5004"
-        except socket.gaierror:
-            pass
+        payer_psp_url = _detect_payer_psp_url()
         
         logger.info(f"Sending edited ReqPay: {payer_vpa} -> {payee_vpa}, Amount: {amount}, TxnId: {txn_id}")
         
         # Send to Payer PSP
         try:
             req_start = datetime.utcnow()
-            response = requests.post(
+            response = _SESSION.post(
                 f"{payer_psp_url.rstrip('/')}/api/reqpay",
                 data=edited_xml.encode('utf-8'),
-                headers={"Content-Type": "application/xml"},
                 timeout=10
             )
             req_duration = int((datetime.utcnow() - req_start).total_seconds() * 1000)
+            ts = _now_ts()
             
             steps[-1]["status"] = "success"
             steps[-1]["description"] = f"Edited ReqPay sent to Payer PSP (TxnId: {txn_id})"
             
-            # Get payer info for balance estimation
-            payer = next((u for u in PAYER_USERS if u["vpa"] == payer_vpa), {"balance": 10000})
-            
             if response.status_code == 202:
                 # Success - show complete flow
                 add_step(
@@ -440,50 +539,16 @@ def send_edited_reqpay():
                     step_type="reqpay_npci"
                 )
                 
-                # ReqPay DEBIT (preserve purpose from edited ReqPay per upi_pay_request.xsd)
-                purpose = _get_txn_purpose_from_reqpay(edited_xml) or "PAY"
-                reqpay_debit = build_reqpay_debit_xml(txn_id, msg_id, payer_vpa, amount, payer_code=payer_code, purpose=purpose)
-                add_step(
-                    "3. ReqPay DEBIT (NPCI → Remitter Bank)",
-                    "success",
-                    f"NPCI sent DEBIT request to debit ₹{amount:.2f} from {payer_vpa}",
-                    xml_data=reqpay_debit,
-                    step_type="reqpay_debit"
-                )
-                
-                # RespPay DEBIT
-                estimated_balance = payer.get("balance", 10000) - amount
-                resppay_debit = build_resppay_debit_xml(txn_id, msg_id, "SUCCESS", estimated_balance)
-                add_step(
-                    "4. RespPay DEBIT (Remitter Bank → NPCI)",
-                    "success",
-                    f"Remitter Bank confirmed debit. Remaining balance: ₹{estimated_balance:.2f}",
-                    xml_data=resppay_debit,
-                    step_type="resppay_debit"
-                )
-                
-                # ReqPay CREDIT (same purpose as DEBIT)
-                reqpay_credit = build_reqpay_credit_xml(txn_id, msg_id, payer_vpa, payee_vpa, amount, payer_code=payer_code, payee_code=payee_code, purpose=purpose)
-                add_step(
-                    "5. ReqPay CREDIT (NPCI → Beneficiary Bank)",
-                    "success",
-                    f"NPCI sent CREDIT request to credit ₹{amount:.2f} to {payee_vpa}",
-                    xml_data=reqpay_credit,
-                    step_type="reqpay_credit"
-                )
-                
-                # RespPay CREDIT
-                resppay_credit = build_resppay_credit_xml(txn_id, msg_id, "SUCCESS", amount + 1000)
-                add_step(
-                    "6. RespPay CREDIT (Beneficiary Bank → NPCI)",
-                    "success",
-                    f"Beneficiary Bank confirmed credit to {payee_vpa}",
-                    xml_data=resppay_credit,
-                    step_type="resppay_credit"
+                # Update in-memory balances so /api/users returns correct values; the pre-debit
+                # balance comes from the same locked update so concurrent payments can't interleave
+                payer_balance = _update_balances_on_success(payer_vpa, payee_vpa, amount)
+                _add_settlement_steps(
+                    add_step, txn_id, msg_id, payer_vpa, payee_vpa, amount, payer_balance, ts,
+                    payer_code=payer_code, payee_code=payee_code, purpose=purpose,
                 )
                 
                 # Final success
-                total_duration = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+                total_duration = (time.perf_counter_ns() - start_perf) // 1_000_000
                 add_step(
                     "Transaction Complete",
                     "success",
@@ -491,8 +556,6 @@ def send_edited_reqpay():
                     duration_ms=total_duration,
                     step_type="complete"
                 )
-                # Update in-memory balances so /api/users returns correct values
-                _update_balances_on_success(payer_vpa, payee_vpa, amount)
                 return jsonify(
                     success=True,
                     message="Transaction successful!",
@@ -521,10 +584,9 @@ def send_edited_reqpay():
                     add_step("2. Validation Failed (Payer PSP)", "error", f"Payer PSP rejected: {error_msg}", step_type="error")
                 elif error_code in remitter_bank_errors or error_code:
                     add_step("2. ReqPay XML (Payer PSP → NPCI)", "success", "PIN validated. Forwarded to NPCI", xml_data=edited_xml, step_type="reqpay_npci")
-                    purpose = _get_txn_purpose_from_reqpay(edited_xml) or "PAY"
-                    reqpay_debit = build_reqpay_debit_xml(txn_id, msg_id, payer_vpa, amount, payer_code=payer_code, purpose=purpose)
+                    reqpay_debit = build_reqpay_debit_xml(txn_id, msg_id, payer_vpa, amount, payer_code=payer_code, purpose=purpose, ts=ts)
                     add_step("3. ReqPay DEBIT (NPCI → Remitter Bank)", "success", f"NPCI sent DEBIT request for ₹{amount:.2f}", xml_data=reqpay_debit, step_type="reqpay_debit")
-                    resppay_debit_fail = build_resppay_debit_xml(txn_id, msg_id, result="FAILURE", err_code=error_code)
+                    resppay_debit_fail = build_resppay_debit_xml(txn_id, msg_id, result="FAILURE", err_code=error_code, ts=ts)
                     add_step("4. RespPay DEBIT - FAILED (Remitter Bank → NPCI)", "error", f"Remitter Bank rejected: {error_code} - {error_msg}", xml_data=resppay_debit_fail, step_type="resppay_debit")
                 else:
                     add_step("Transaction Failed", "error", error_msg, step_type="error")
@@ -549,13 +611,14 @@ def create_transaction():
     """Create a new UPI transaction with detailed timeline steps showing all XMLs."""
     steps = []
     start_time = datetime.utcnow()
+    start_perf = time.perf_counter_ns()
     
     def add_step(title, status, description, xml_data=None, duration_ms=None, step_type=None):
         step = {
             "title": title,
             "status": status,  # pending, processing, success, error
             "description": description,
-            "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            "timestamp": (start_time + timedelta(microseconds=(time.perf_counter_ns() - start_perf) // 1000)).isoformat(sep=" ", timespec="milliseconds"),
         }
         if xml_data:
             step["xml"] = xml_data
@@ -589,7 +652,7 @@ def create_transaction():
             return jsonify(success=False, error="Missing required fields", steps=steps), 200
         
         # Basic validation only - let Payer PSP handle business rules
-        payer = next((u for u in PAYER_USERS if u["vpa"] == payer_vpa), None)
+        payer = _PAYER_BY_VPA.get(payer_vpa)
         if not payer:
             add_step("Input Validation", "error", f"Invalid payer VPA: {payer_vpa}")
             return jsonify(success=False, error="Invalid payer VPA", steps=steps), 200
@@ -606,33 +669,28 @@ def create_transaction():
         )
         
         xml_body, txn_id, msg_id = build_reqpay_xml(payer_vpa, payee_vpa, amount, pin)
-        pretty_req_xml = prettify_xml(xml_body.decode('utf-8'))
+        pretty_req_xml = xml_body.decode('utf-8')
+        if _pretty_requested():
+            pretty_req_xml = prettify_xml(pretty_req_xml)
         
         steps[-1]["status"] = "success"
         steps[-1]["description"] = f"ReqPay built and sent to Payer PSP (TxnId: {txn_id})"
         steps[-1]["xml"] = pretty_req_xml
         
-        # Detect PSP URL
-        payer_psp_url = PAYER_PSP_URL
-        try:
-            import socket
-            socket.gethostbyname('payer_psp')
-            payer_psp_url = "http://payer_psp:5004"
-        except socket.gaierror:
-            pass
+        payer_psp_url = _detect_payer_psp_url()
         
         logger.info(f"Sending transaction: {payer_vpa} -> {payee_vpa}, Amount: {amount}")
         
         # Step 3: Send to Payer PSP and wait for response
         try:
             req_start = datetime.utcnow()
-            response = requests.post(
+            response = _SESSION.post(
                 f"{payer_psp_url.rstrip('/')}/api/reqpay",
                 data=xml_body,
-                headers={"Content-Type": "application/xml"},
                 timeout=10
             )
             req_duration = int((datetime.utcnow() - req_start).total_seconds() * 1000)
+            ts = _now_ts()
             
             if response.status_code == 202:
                 # Transaction successful - show the complete internal flow
@@ -646,49 +704,15 @@ def create_transaction():
                     step_type="reqpay_npci"
                 )
                 
-                # Step 4: ReqPay DEBIT (NPCI → Remitter Bank)
-                reqpay_debit = build_reqpay_debit_xml(txn_id, msg_id, payer_vpa, amount)
-                add_step(
-                    "3. ReqPay DEBIT (NPCI → Remitter Bank)",
-                    "success",
-                    f"NPCI sent DEBIT request to debit ₹{amount:.2f} from {payer_vpa}",
-                    xml_data=reqpay_debit,
-                    step_type="reqpay_debit"
-                )
-                
-                # Step 5: RespPay DEBIT (Remitter Bank → NPCI)
-                estimated_balance = payer.get("balance", 10000) - amount
-                resppay_debit = build_resppay_debit_xml(txn_id, msg_id, "SUCCESS", estimated_balance)
-                add_step(
-                    "4. RespPay DEBIT (Remitter Bank → NPCI)",
-                    "success",
-                    f"Remitter Bank confirmed debit. Remaining balance: ₹{estimated_balance:.2f}",
-                    xml_data=resppay_debit,
-                    step_type="resppay_debit"
-                )
-                
-                # Step 6: ReqPay CREDIT (NPCI → Beneficiary Bank)
-                reqpay_credit = build_reqpay_credit_xml(txn_id, msg_id, payer_vpa, payee_vpa, amount)
-                add_step(
-                    "5. ReqPay CREDIT (NPCI → Beneficiary Bank)",
-                    "success",
-                    f"NPCI sent CREDIT request to credit ₹{amount:.2f} to {payee_vpa}",
-                    xml_data=reqpay_credit,
-                    step_type="reqpay_credit"
-                )
-                
-                # Step 7: RespPay CREDIT (Beneficiary Bank → NPCI)
-                resppay_credit = build_resppay_credit_xml(txn_id, msg_id, "SUCCESS", amount + 1000)  # Simulated new balance
-                add_step(
-                    "6. RespPay CREDIT (Beneficiary Bank → NPCI)",
-                    "success",
-                    f"Beneficiary Bank confirmed credit to {payee_vpa}",
-                    xml_data=resppay_credit,
-                    step_type="resppay_credit"
+                # Steps 4-7: DEBIT and CREDIT legs between NPCI and the banks; the in-memory
+                # balances are updated first so /api/users and the RespPay estimate agree
+                payer_balance = _update_balances_on_success(payer_vpa, payee_vpa, amount)
+                _add_settlement_steps(
+                    add_step, txn_id, msg_id, payer_vpa, payee_vpa, amount, payer_balance, ts,
                 )
                 
                 # Final success step
-                total_duration = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+                total_duration = (time.perf_counter_ns() - start_perf) // 1_000_000
                 add_step(
                     "Transaction Complete",
                     "success",
@@ -696,8 +720,6 @@ def create_transaction():
                     duration_ms=total_duration,
                     step_type="complete"
                 )
-                # Update in-memory balances so /api/users returns correct values
-                _update_balances_on_success(payer_vpa, payee_vpa, amount)
                 return jsonify(
                     success=True,
                     message="Transaction successful!",
@@ -748,7 +770,7 @@ def create_transaction():
                     )
                     
                     # Step: NPCI → Remitter Bank (success - request was sent)
-                    reqpay_debit = build_reqpay_debit_xml(txn_id, msg_id, payer_vpa, amount)
+                    reqpay_debit = build_reqpay_debit_xml(txn_id, msg_id, payer_vpa, amount, ts=ts)
                     add_step(
                         "3. ReqPay DEBIT (NPCI → Remitter Bank)",
                         "success",
@@ -758,7 +780,7 @@ def create_transaction():
                     )
                     
                     # Step: Remitter Bank → NPCI (FAILED - with error response XML, per upi_resppay_response.xsd)
-                    resppay_debit_fail = build_resppay_debit_xml(txn_id, msg_id, result="FAILURE", err_code=error_code)
+                    resppay_debit_fail = build_resppay_debit_xml(txn_id, msg_id, result="FAILURE", err_code=error_code, ts=ts)
                     add_step(
                         "4. RespPay DEBIT - FAILED (Remitter Bank → NPCI)",
                         "error",
@@ -829,7 +851,12 @@ if __name__ == "__main__":
     logger.info(f"[Payment UI] Debug mode: {debug_mode}")
     
     try:
-        app.run(host="0.0.0.0", port=port, debug=debug_mode)
+        if debug_mode:
+            app.run(host="0.0.0.0", port=port, debug=True)
+        else:
+            from waitress import serve
+            # Handlers run concurrently: shared balances and the users body are guarded by _USERS_LOCK
+            serve(app, host="0.0.0.0", port=port, threads=int(os.environ.get("WSGI_THREADS", "16")))
     except Exception as e:
         logger.error(f"[Payment UI] Failed to start: {e}")
         raise
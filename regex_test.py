@@ -24,6 +24,12 @@ details = """SEARCH:         if not account:
             bal_amt = account.balance
 REPLACE: REPLACE_TEXT"""
 
+def _replace_from(text, i, old, new):
+    """text.replace(old, new) given the first match at i: the prefix before it is not rescanned."""
+    if not old:
+        return text.replace(old, new)
+    return text[:i] + new + text[i + len(old):].replace(old, new)
+
 def parse_and_apply(content, details):
     import re
     # Divide string by SEARCH: markers
@@ -48,14 +54,16 @@ def parse_and_apply(content, details):
                 
                 print(f"Parsed SEARCH (len={len(search_text)}):\n{repr(search_text)}")
                 
-                if search_text in temp_content:
+                i = temp_content.find(search_text)
+                if i >= 0:
                     print("MATCH FOUND")
-                    temp_content = temp_content.replace(search_text, replace_text)
+                    temp_content = _replace_from(temp_content, i, search_text, replace_text)
                 else:
                     # Fallback: try stripping leading space if SEARCH: <space><code>
-                    if search_text.startswith(' ') and search_text[1:] in temp_content:
+                    i = temp_content.find(search_text[1:]) if search_text.startswith(' ') else -1
+                    if i >= 0:
                          print("MATCH FOUND (after stripping one leading space)")
-                         temp_content = temp_content.replace(search_text[1:], replace_text)
+                         temp_content = _replace_from(temp_content, i, search_text[1:], replace_text)
                     else:
                         print("MATCH NOT FOUND")
     return temp_content
@@ -1,16 +1,30 @@
+import atexit
 import logging
 import os
+import queue
+import random
+import re
+import shutil
 import sys
-import xml.etree.ElementTree as ET
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
+import orjson
+import pybreaker
 import requests
+from cachetools import TTLCache
 from flask import Flask, jsonify, request
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from sqlalchemy.exc import IntegrityError
 
-from db import get_account_by_vpa, init_db, seed_sample_accounts
+from db import debit, get_engine, init_db, recorded_debit, seed_sample_accounts
+from service_util import ORJSONProvider, escape_attr, xsd_path
 
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s [%(levelname)s] [rem_bank] %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
     stream=sys.stderr,
@@ -24,19 +38,88 @@ werkzeug_logger.setLevel(logging.INFO)
 
 # Minimum transaction amount (in rupees) enforced for all debit transactions
 MIN_TXN_AMOUNT = 1
-# Supported UPI purpose codes. Extend as needed.
-PURPOSE_CODES = {
+# Supported UPI purpose codes (labels for logging). Extend as needed.
+PURPOSE_CODE_LABELS = {
     "44": "Utility Payments",  # Added per change manifest
 }
+PURPOSE_CODES: frozenset = frozenset(PURPOSE_CODE_LABELS)
+# ReqPay bodies outside this size range are rejected before parsing
+REQPAY_MIN_BYTES = 64
+REQPAY_MAX_BYTES = 64 * 1024
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 NS = "http://npci.org/upi/schema/"
 NPCI_URL = os.environ.get("NPCI_URL", "http://npci:5000")
+_engine = None
 _session_factory = None
 
+# Shared keep-alive pool for outbound NPCI and orchestrator calls
+_http = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0)
+_http.mount("http://", _adapter)
+_http.mount("https://", _adapter)
+
+# RespPay callbacks to NPCI run here so reqpay() can return 202 without waiting on NPCI
+_bg = ThreadPoolExecutor(max_workers=16, thread_name_prefix="npci-cb")
+atexit.register(_bg.shutdown, wait=False)
+
+
+def _is_client_error(e: Exception) -> bool:
+    return isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code < 500
+
+
+# Opens after 5 consecutive connect/timeout/5xx failures to NPCI; callbacks are dropped for 30s
+# instead of each holding an executor thread. A 4xx means NPCI is up and rejected the body, so it
+# does not count.
+_npci_cb = pybreaker.CircuitBreaker(fail_max=5, reset_timeout=30, exclude=[_is_client_error])
+_RESPPAY_ATTEMPTS = 3
+
+# How long a ReqPay msgId counts as "already seen"; long enough to absorb retries of one
+# payment, short enough that fixed-msgId samples (scripts/sample_reqpay.xml) can be rerun
+DEDUP_WINDOW_S = float(os.environ.get("REQPAY_DEDUP_WINDOW_S", "60"))
+# (msgId, payer, amount) -> (body, status) of the accepted reqpay(); identical retries replay it
+# without touching the DB. debit_log covers retries that outlive this cache or the process and
+# rejects a reused msgId whose payer or amount differs.
+_idem: TTLCache = TTLCache(maxsize=100_000, ttl=DEDUP_WINDOW_S)
+_idem_lock = threading.Lock()
+
+
+def _load_reqpay_xsd() -> bytes | None:
+    """Read upi_pay_request.xsd once; None (validation skipped) if the file is absent."""
+    path = xsd_path(__file__, "upi_pay_request.xsd")
+    if not os.path.isfile(path):
+        logger.warning("ReqPay XSD not found at %s; incoming ReqPay will not be schema-validated", path)
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+_REQPAY_XSD = _load_reqpay_xsd()
+_parser_local = threading.local()
+
+
+def _reqpay_parser() -> etree.XMLParser:
+    """
+    Per-thread ReqPay parser that validates against the XSD in C while parsing.
+    lxml drops the GIL while parsing, so request threads parse in parallel; parsers and
+    schemas must not be shared between threads, hence one compiled pair per thread.
+    """
+    parser = getattr(_parser_local, "parser", None)
+    if parser is None:
+        schema = etree.XMLSchema(etree.fromstring(_REQPAY_XSD)) if _REQPAY_XSD else None
+        parser = etree.XMLParser(schema=schema, remove_blank_text=True, resolve_entities=False, no_network=True)
+        _parser_local.parser = parser
+    return parser
+
 
 # Request logging middleware
 @app.before_request
 def log_request():
+    # Health probes are the bulk of the traffic and never worth a log line
+    if request.path == "/health" or not logger.isEnabledFor(logging.INFO):
+        return
     logger.info("==> Incoming %s %s | Content-Type: %s | Content-Length: %s | Remote: %s",
                 request.method, request.path,
                 request.content_type or "N/A",
@@ -44,17 +127,18 @@ def log_request():
                 request.remote_addr)
     if request.args:
         logger.info("    Query params: %s", dict(request.args))
-    if request.is_json:
-        logger.info("    JSON body: %s", request.get_json())
+    if request.is_json and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("    JSON body: %s", request.get_json(cache=True))
 
 
 @app.after_request
 def log_response(response):
-    logger.info("<== Response %s %s | Status: %s | Content-Type: %s | Content-Length: %s",
-                request.method, request.path,
-                response.status_code,
-                response.content_type or "N/A",
-                response.content_length or 0)
+    if request.path != "/health" and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("<== Response %s %s | Status: %s | Content-Type: %s | Content-Length: %s",
+                     request.method, request.path,
+                     response.status_code,
+                     response.content_type or "N/A",
+                     response.content_length or 0)
     return response
 
 
@@ -62,28 +146,39 @@ def _qname(tag: str) -> str:
     return f"{{{NS}}}{tag}"
 
 
+# Byte-level pre-checks: a ReqPay without Head.msgId or an addr attribute is rejected unparsed
+_QUICK_MSGID = re.compile(rb"""msgId\s*=\s*["'][^"']""")
+_QUICK_ADDR = re.compile(rb"""addr\s*=\s*["'][^"']""")
+
+# Descendant paths for _parse_reqpay, built once instead of per call
+_Q_HEAD = f".//{_qname('Head')}"
+_Q_TXN = f".//{_qname('Txn')}"
+_Q_PAYER = f".//{_qname('Payer')}"
+_Q_PURPOSE = f".//{_qname('Purpose')}"
+_Q_AMOUNT = f".//{_qname('Amount')}"
+
+
 def _startup() -> None:
-    global _session_factory
-    _session_factory = init_db()
+    global _engine, _session_factory
+    _engine = get_engine()
+    _session_factory = init_db(_engine)
     with _session_factory() as session:
         seed_sample_accounts(session)
 
 
-def _ensure_session():
-    global _session_factory
-    if _session_factory is None:
-        _startup()
-
-
 def _parse_reqpay(body: bytes) -> dict | None:
     """Extract Head.msgId, Head.ver, Head.orgId, Head.prodType, Txn.id, Txn.type, Payer.addr, Payer/Amount.value, Payer.code, and optional Purpose.code (e.g., 44 for utility payments)."""
+    # Cheap rejects (empty/oversized bodies, JSON or other non-XML) before paying for a parse
+    if not REQPAY_MIN_BYTES <= len(body) <= REQPAY_MAX_BYTES or body.lstrip()[:1] != b"<":
+        return None
+    if not (_QUICK_MSGID.search(body) and _QUICK_ADDR.search(body)):
+        return None
     out = {}
     try:
-        root = ET.fromstring(body)
-        q = lambda n: f".//{{{NS}}}{n}"
-        h = root.find(q("Head"))
-        t = root.find(q("Txn"))
-        p = root.find(q("Payer"))
+        root = etree.fromstring(body, _reqpay_parser())
+        h = root.find(_Q_HEAD)
+        t = root.find(_Q_TXN)
+        p = root.find(_Q_PAYER)
         if h is not None:
             out["msgId"] = (h.get("msgId") or "").strip()
             out["ver"] = (h.get("ver") or "2.0").strip()
@@ -92,8 +187,9 @@ def _parse_reqpay(body: bytes) -> dict | None:
         if t is not None:
             out["txnId"] = (t.get("id") or "").strip()
             out["txnType"] = (t.get("type") or "DEBIT").strip()
-            # Optional Purpose element under Txn
-            purpose_elem = t.find(q("Purpose"))
+            # Optional Purpose element under Txn. The XSD has no such child, so this only
+            # sees a document when the XSD is missing and the parser does not validate.
+            purpose_elem = t.find(_Q_PURPOSE)
             if purpose_elem is not None:
                 out["purposeCode"] = (purpose_elem.get("code") or "").strip()
             # Also check for purpose attribute on Txn (per XSD schema)
@@ -111,7 +207,7 @@ def _parse_reqpay(body: bytes) -> dict | None:
             out["payerType"] = (p.get("type") or "").strip()
             out["payerSeqNum"] = (p.get("seqNum") or "").strip()
             out["payerName"] = (p.get("name") or "").strip()
-            amt = p.find(q("Amount"))
+            amt = p.find(_Q_AMOUNT)
             if amt is not None:
                 out["amount"] = float(amt.get("value") or 0)
             else:
@@ -124,38 +220,57 @@ def _parse_reqpay(body: bytes) -> dict | None:
                         out.get("payerCode"), out.get("payerType"), out.get("payerSeqNum"))
             # MIN_TXN_AMOUNT is enforced in the endpoint so we can return a proper errCode (MIN_AMOUNT_VIOLATION)
             return out if out.get("payerAddr") and out.get("msgId") else None
-    except (ET.ParseError, ValueError, TypeError):
+    except (etree.XMLSyntaxError, ValueError, TypeError):
         return None
 
 
+# RespPay (DEBIT) is fixed-shape and attribute-only, so it is filled from a template, not built as a tree
+_RESPPAY_TMPL = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    f'<ns0:RespPay xmlns:ns0="{NS}">'
+    '<ns0:Head ver="{ver}" ts="{ts}" orgId="REM_BANK" msgId="resppay-debit-{req}" prodType="{pt}"/>'
+    '<ns0:Txn id="{tid}" type="DEBIT"/>'
+    '<ns0:Resp reqMsgId="{req}" result="{result}"{err}>{ref}</ns0:Resp>'
+    '</ns0:RespPay>'
+)
+
+
 def _build_resppay_debit(parsed: dict, result: str, err_code: str | None = None, bal_amt: float | None = None) -> bytes:
     """Build RespPay (type=DEBIT) per common/schemas/upi_resppay_response.xsd."""
-    ts = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-    req_msg = parsed.get("msgId") or "req"
-    root = ET.Element(_qname("RespPay"))
-
-    h = ET.SubElement(root, _qname("Head"))
-    h.set("ver", parsed.get("ver") or "2.0")
-    h.set("ts", ts)
-    h.set("orgId", "REM_BANK")
-    h.set("msgId", f"resppay-debit-{req_msg}")
-    h.set("prodType", parsed.get("prodType") or "UPI")
-
-    t = ET.SubElement(root, _qname("Txn"))
-    t.set("id", parsed.get("txnId") or "unknown")
-    t.set("type", "DEBIT")
-
-    r = ET.SubElement(root, _qname("Resp"))
-    r.set("reqMsgId", req_msg)
-    r.set("result", result)
-    if err_code:
-        r.set("errCode", err_code)
-    if bal_amt is not None:
-        ref = ET.SubElement(r, _qname("Ref"))
-        ref.set("balAmt", f"{bal_amt:.2f}")
-
-    xml_str = ET.tostring(root, encoding="unicode", method="xml")
-    return ('<?xml version="1.0" encoding="UTF-8"?>\n' + xml_str).encode("utf-8")
+    return _RESPPAY_TMPL.format(
+        ver=escape_attr(parsed.get("ver") or "2.0"),
+        ts=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        req=escape_attr(parsed.get("msgId") or "req"),
+        pt=escape_attr(parsed.get("prodType") or "UPI"),
+        tid=escape_attr(parsed.get("txnId") or "unknown"),
+        result=escape_attr(result),
+        err=f' errCode="{escape_attr(err_code)}"' if err_code else "",
+        ref=f'<ns0:Ref balAmt="{bal_amt:.2f}"/>' if bal_amt is not None else "",
+    ).encode("utf-8")
+
+
+def _send_resppay(url: str, resppay_bytes: bytes) -> None:
+    resp = _http.post(url, data=resppay_bytes, headers={"Content-Type": "application/xml"}, timeout=2)
+    resp.raise_for_status()
+
+
+def _post_resppay(resppay_bytes: bytes, msg_id: str | None) -> None:
+    """Best-effort RespPay (DEBIT) delivery to NPCI behind _npci_cb; runs on the _bg executor."""
+    url = f"{NPCI_URL.rstrip('/')}/api/resppay"
+    for attempt in range(_RESPPAY_ATTEMPTS):
+        try:
+            _npci_cb.call(_send_resppay, url, resppay_bytes)
+            return
+        except pybreaker.CircuitBreakerError:
+            logger.warning("[rem_bank] NPCI circuit open; dropping RespPay for msgId=%s", msg_id)
+            return
+        except requests.RequestException as e:
+            # A 4xx would be rejected again, so only connect/timeout/5xx failures are retried
+            if attempt + 1 == _RESPPAY_ATTEMPTS or _is_client_error(e):
+                logger.warning("[rem_bank] RespPay to NPCI failed for msgId=%s: %s", msg_id, e)
+                return
+            # Exponential backoff with jitter so retries from many callbacks don't align
+            time.sleep(0.2 * 2 ** attempt + random.uniform(0, 0.1))
 
 
 @app.get("/health")
@@ -172,16 +287,21 @@ def reqpay() -> tuple[dict, int]:
     if not request.data:
         return jsonify(error="Missing body"), 400
     
-    # Log received XML for debugging
-    try:
-        logger.info("[rem_bank] /api/reqpay received body (first 500 chars): %s", (request.data or b"")[:500].decode("utf-8", errors="replace"))
-    except Exception:
-        logger.info("[rem_bank] /api/reqpay received body len=%s", len(request.data or b""))
+    # Log received XML for debugging (DEBUG only; memoryview slice avoids copying the whole body)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[rem_bank] /api/reqpay received body (first 500 chars): %s",
+                     memoryview(request.data)[:500].tobytes().decode("utf-8", "replace"))
     
-    _ensure_session()
     parsed = _parse_reqpay(request.data)
     if not parsed:
         return jsonify(error="Invalid ReqPay: could not parse Payer.addr and Amount"), 400
+    msg_id = parsed["msgId"]
+    idem_key = (msg_id, parsed["payerAddr"], round(parsed["amount"], 2))
+    with _idem_lock:
+        cached = _idem.get(idem_key)
+    if cached is not None:
+        logger.info("[rem_bank] Duplicate ReqPay msgId=%s; replaying cached response", msg_id)
+        return jsonify(cached[0]), cached[1]
 
     logger.info(
         "[rem_bank] Received ReqPay DEBIT from NPCI | Payer=%s | Amount=%s | Txn.id=%s",
@@ -193,49 +313,37 @@ def reqpay() -> tuple[dict, int]:
     if parsed.get("payerCode") == "1111":
         return jsonify(error="Code Blocked for Demo", status="rejected"), 400
 
-    result = "SUCCESS"
-    err_code = None
-    bal_amt = None
-    with _session_factory() as session:
-        account = get_account_by_vpa(session, parsed["payerAddr"])
-        amount = parsed["amount"]
-        # Debug: account and amount (use logger so it shows in: docker compose logs -f rem_bank)
-        logger.info(
-            "[rem_bank] DEBUG account=%s balance=%s amount=%s",
-            account.id if account else None,
-            getattr(account, "balance", None),
-            amount,
-        )
-        if not account:
-            result = "FAILURE"
-            err_code = "PAYER_NOT_FOUND"
-        elif amount < MIN_TXN_AMOUNT:
-            result = "FAILURE"
-            err_code = "MIN_AMOUNT_VIOLATION"
-        elif account.balance < amount:
-            result = "FAILURE"
-            err_code = "INSUFFICIENT_BALANCE"
-        else:
-            account.balance -= amount
-            session.flush()  # ensure UPDATE is sent before commit
-            session.commit()
-            bal_amt = account.balance
-
+    # Single UPDATE ... RETURNING: balance check and debit happen atomically in SQL
+    try:
+        with _engine.begin() as conn:
+            result, bal_amt = debit(
+                conn, parsed["payerAddr"], parsed["amount"], MIN_TXN_AMOUNT, msg_id, DEDUP_WINDOW_S
+            )
+    except IntegrityError:
+        # A concurrent request with the same msgId committed first and this debit was rolled back;
+        # it is a duplicate only if that request debited the same payer and amount
+        with _engine.connect() as conn:
+            result, bal_amt = recorded_debit(conn, parsed["payerAddr"], parsed["amount"], msg_id)
+    logger.info("[rem_bank] Debit %s | Payer=%s | Amount=%s | balAmt=%s",
+                result, parsed["payerAddr"], parsed["amount"], bal_amt)
+
+    accepted = {"status": "accepted"}
+    if result == "DUPLICATE":
+        # Already debited (and RespPay already sent) for this msgId, payer and amount
+        return jsonify(accepted), 202
+    if result == "MSG_ID_CONFLICT":
+        logger.warning("[rem_bank] ReqPay msgId=%s reused with a different payer/amount; rejected", msg_id)
+        return jsonify(error=result, status="rejected"), 409
     if result != "SUCCESS":
-        return jsonify(error=err_code, status="rejected"), 400
+        return jsonify(error=result, status="rejected"), 400
 
-    resppay_bytes = _build_resppay_debit(parsed, result=result, err_code=err_code, bal_amt=bal_amt)
-    try:
-        requests.post(
-            f"{NPCI_URL.rstrip('/')}/api/resppay",
-            data=resppay_bytes,
-            headers={"Content-Type": "application/xml"},
-            timeout=10,
-        )
-    except requests.RequestException:
-        pass  # best-effort; return 202 to NPCI for successful initiation
+    resppay_bytes = _build_resppay_debit(parsed, result=result, bal_amt=bal_amt)
+    # Debit is committed; deliver RespPay off the request thread
+    _bg.submit(_post_resppay, resppay_bytes, msg_id)
 
-    return jsonify(status="accepted"), 202
+    with _idem_lock:
+        _idem[idem_key] = (accepted, 202)
+    return jsonify(accepted), 202
 
 
 # ============================================================================
@@ -273,9 +381,84 @@ def _get_rem_bank_agent():
     return _rem_bank_agent
 
 
+_ORCH_URL = os.environ.get("ORCHESTRATOR_URL", "http://orchestrator:6000")
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# Updates for the same change_id arriving within this window collapse to the newest one
+_STATUS_COALESCE_S = 0.05
+
+# (change_id, body, timeout) status updates, drained and coalesced by _status_sender
+_status_q: "queue.Queue[tuple[str, bytes, float]]" = queue.Queue()
+# (agent, manifest) pairs waiting for process_manifest, drained by _manifest_worker
+_manifest_q: "queue.Queue[tuple]" = queue.Queue()
+_workers_lock = threading.Lock()
+_workers: dict[str, threading.Thread] = {}
+
+
+def _ensure_worker(name: str, target) -> None:
+    """Start a daemon worker on first use (per process, so it also exists in forked workers)."""
+    with _workers_lock:
+        t = _workers.get(name)
+        if t is None or not t.is_alive():
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            _workers[name] = t
+
+
+def _status_sender() -> None:
+    """Post queued status updates, keeping only the newest per change_id in each window."""
+    while True:
+        change_id, body, timeout = _status_q.get()
+        latest = {change_id: (body, timeout)}
+        time.sleep(_STATUS_COALESCE_S)
+        while True:
+            try:
+                change_id, body, timeout = _status_q.get_nowait()
+            except queue.Empty:
+                break
+            latest[change_id] = (body, timeout)
+        for body, timeout in latest.values():
+            try:
+                _http.post(f"{_ORCH_URL}/api/orchestrator/status", data=body, headers=_JSON_HEADERS, timeout=timeout)
+            except Exception as e:
+                logger.warning("[Rem Bank Agent] Failed to update orchestrator: %s", e)
+
+
+def _notify_orchestrator(change_id: str, agent_id: str, status: str, details, timeout: float) -> None:
+    """Queue a status update for the orchestrator without blocking the caller."""
+    body = orjson.dumps({"change_id": change_id, "agent_id": agent_id, "status": status, "details": details})
+    _ensure_worker("orch-status", _status_sender)
+    _status_q.put((change_id, body, timeout))
+
+
+def _manifest_worker() -> None:
+    """Run process_manifest for queued manifests and report the final status."""
+    while True:
+        agent, manifest = _manifest_q.get()
+        try:
+            process_result = agent.process_manifest(manifest)
+            # Ensure process_result has a message field for better logging
+            final_message = process_result.get("message", "")
+            if not final_message:
+                applied_count = len(process_result.get("applied_changes", []))
+                final_message = f"Processing complete. {applied_count} file(s) updated successfully."
+            _notify_orchestrator(
+                manifest.change_id,
+                agent.agent_id,
+                process_result.get("status", "RECEIVED"),
+                {"message": final_message, **process_result},
+                timeout=5,
+            )
+        except Exception as e:
+            logger.error("[Rem Bank Agent] Error processing manifest: %s", e)
+            _notify_orchestrator(manifest.change_id, agent.agent_id, "ERROR",
+                                 {"message": f"Processing failed: {e}"}, timeout=5)
+        finally:
+            _manifest_q.task_done()
+
+
 @app.post("/api/agent/manifest")
 def receive_manifest_endpoint():
-    """Receive manifest via A2A protocol."""
+    """Receive manifest via A2A protocol; processing continues on the manifest worker."""
     agent = _get_rem_bank_agent()
     if not agent:
         return jsonify(error="Remitter Bank Agent not available"), 503
@@ -299,69 +482,19 @@ def receive_manifest_endpoint():
         # Receive and acknowledge manifest
         result = agent.receive_manifest(manifest)
         
-        # Update orchestrator immediately when manifest is received
-        try:
-            import requests as req
-            orchestrator_url = os.environ.get("ORCHESTRATOR_URL", "http://orchestrator:6000")
-            # Try localhost fallback
-            try:
-                req.post(
-                    f"{orchestrator_url}/api/orchestrator/status",
-                    json={
-                        "change_id": manifest.change_id,
-                        "agent_id": agent.agent_id,
-                        "status": "RECEIVED",
-                        "details": f"Received manifest: '{manifest.description[:100]}'"
-                    },
-                    timeout=2,
-                )
-            except:
-                req.post(
-                    "http://localhost:9991/api/orchestrator/status",
-                    json={
-                        "change_id": manifest.change_id,
-                        "agent_id": agent.agent_id,
-                        "status": "RECEIVED",
-                        "details": f"Received manifest: '{manifest.description[:100]}'"
-                    },
-                    timeout=2,
-                )
-        except Exception as e:
-            logger.warning(f"Failed to update orchestrator: {e}")
+        # Update orchestrator as soon as the manifest is received
+        _notify_orchestrator(
+            manifest.change_id,
+            agent.agent_id,
+            "RECEIVED",
+            f"Received manifest: '{manifest.description[:100]}'",
+            timeout=2,
+        )
         
-        # Process manifest asynchronously in background if needed
-        # For now, process synchronously
-        try:
-            process_result = agent.process_manifest(manifest)
-            
-            # Update orchestrator with final status
-            try:
-                import requests as req
-
-                orchestrator_url = os.environ.get("ORCHESTRATOR_URL", "http://orchestrator:6000")
-                # Ensure process_result has a message field for better logging
-                final_message = process_result.get("message", "")
-                if not final_message:
-                    applied_count = len(process_result.get("applied_changes", []))
-                    final_message = f"Processing complete. {applied_count} file(s) updated successfully."
-                
-                req.post(
-                    f"{orchestrator_url}/api/orchestrator/status",
-                    json={
-                        "change_id": manifest.change_id,
-                        "agent_id": agent.agent_id,
-                        "status": process_result.get("status", "RECEIVED"),
-                        "details": {"message": final_message, **process_result},
-                    },
-                    timeout=5,
-                )
-            except Exception as e:
-                logger.warning(f"[Rem Bank Agent] Failed to update orchestrator: {e}")
-            
-            return jsonify(process_result), 200
-        except Exception as e:
-            logger.error(f"[Rem Bank Agent] Error processing manifest: {e}")
-            return jsonify({**result, "processing_error": str(e)}), 200
+        # process_manifest (LLM + code updates) and the final status run on the worker
+        _ensure_worker("manifest-worker", _manifest_worker)
+        _manifest_q.put((agent, manifest))
+        return jsonify(result), 200
         
     except Exception as e:
         logger.error(f"[Rem Bank Agent] Error receiving manifest: {e}")
@@ -381,10 +514,18 @@ def get_agent_status(change_id: str):
     return jsonify(error="Change not found"), 404
 
 
+if __name__ == "__main__" and os.environ.get("RUNTIME", "gunicorn") == "gunicorn" and shutil.which("gunicorn"):
+    # Hand off before _startup(): the gunicorn master imports this module and runs it there,
+    # so doing it here too would seed twice. RUNTIME=flask keeps the Werkzeug dev server.
+    _conf = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn_conf.py")
+    logger.info("[rem_bank] Starting gunicorn on 0.0.0.0:%s (logs go to stderr -> docker compose logs)",
+                os.environ.get("PORT", 5000))
+    os.execvp("gunicorn", ["gunicorn", "-c", _conf, "app:app"])
+
+# Build the engine and seed at import so no request pays the cold start
+_startup()
+
 if __name__ == "__main__":
-    _startup()
     port = int(os.environ.get("PORT", 5000))
     logger.info("[rem_bank] Starting on 0.0.0.0:%s (logs go to stderr -> docker compose logs)", port)
     app.run(host="0.0.0.0", port=port)
-
-
@@ -1,10 +1,13 @@
 from .db import (
     Account,
     Base,
+    DebitLog,
+    debit,
     get_account_by_vpa,
     get_engine,
     init_db,
     make_session_factory,
+    recorded_debit,
     seed_sample_accounts,
     upsert_account,
 )
@@ -12,10 +15,13 @@ from .db import (
 __all__ = [
     "Account",
     "Base",
+    "DebitLog",
+    "debit",
     "get_account_by_vpa",
     "get_engine",
     "init_db",
     "make_session_factory",
+    "recorded_debit",
     "seed_sample_accounts",
     "upsert_account",
 ]
@@ -1,14 +1,17 @@
 """
-Remitter bank–scoped SQLite database: Account table only.
+Remitter bank–scoped SQLite database: accounts and the debit_log idempotency table.
 Separate from common/db so rem_bank owns its own data.
 """
 from __future__ import annotations
 
 import os
+import time
 from typing import Optional
 
-from sqlalchemy import Column, Float, String, create_engine
+from sqlalchemy import Column, Float, String, create_engine, event, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 Base = declarative_base()
 
@@ -16,12 +19,26 @@ Base = declarative_base()
 class Account(Base):
     __tablename__ = "accounts"
     id = Column(String(64), primary_key=True)
-    vpa = Column(String(255), nullable=False, unique=True)
+    vpa = Column(String(255), nullable=False, unique=True, index=True)
     name = Column(String(255), nullable=False)
     bank_code = Column(String(64), nullable=False)
     balance = Column(Float, nullable=False, default=0.0)
 
 
+class DebitLog(Base):
+    """
+    One row per applied debit. A ReqPay replayed within the dedup window with the same
+    (msg_id, vpa, amount) is a no-op; the same msg_id with a different payer or amount is
+    rejected. Reset whenever the sample balances are reseeded.
+    """
+    __tablename__ = "debit_log"
+    msg_id = Column(String(128), primary_key=True)
+    vpa = Column(String(255), nullable=False)
+    amount = Column(Float, nullable=False)
+    balance = Column(Float, nullable=False)
+    created_at = Column(Float, nullable=False)  # epoch seconds
+
+
 def _default_db_path() -> str:
     """Path to rem_bank.sqlite in the app root (parent of db/). Works in Docker and locally."""
     app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -34,8 +51,29 @@ def get_engine(db_url: Optional[str] = None):
         or os.getenv("DATABASE_URL")
         or f"sqlite:///{_default_db_path()}"
     )
-    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
-    return create_engine(url, echo=False, future=True, connect_args=connect_args)
+    if url.startswith("sqlite"):
+        # SQLAlchemy 2.x already pools file-backed SQLite connections per thread
+        engine = create_engine(url, echo=False, future=True, connect_args={"check_same_thread": False})
+        event.listen(engine, "connect", _sqlite_pragmas)
+        return engine
+    return create_engine(
+        url,
+        echo=False,
+        future=True,
+        poolclass=QueuePool,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "8")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "16")),
+        pool_recycle=1800,
+        pool_pre_ping=True,
+    )
+
+
+def _sqlite_pragmas(dbapi_conn, _record) -> None:
+    """WAL lets readers run alongside the debit writer; NORMAL skips the per-commit fsync of the WAL."""
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.close()
 
 
 def make_session_factory(engine):
@@ -54,6 +92,79 @@ def get_account_by_vpa(session: Session, vpa: str) -> Optional[Account]:
     return session.query(Account).filter_by(vpa=vpa.strip()).one_or_none()
 
 
+_DEBIT_LOG_GET_SQL = text("SELECT vpa, amount, balance, created_at FROM debit_log WHERE msg_id = :msg_id")
+_DEBIT_LOG_DEL_SQL = text("DELETE FROM debit_log WHERE msg_id = :msg_id")
+_DEBIT_LOG_ADD_SQL = text(
+    "INSERT INTO debit_log (msg_id, vpa, amount, balance, created_at) "
+    "VALUES (:msg_id, :vpa, :amt, :bal, :now)"
+)
+_DEBIT_SQL = text(
+    "UPDATE accounts SET balance = balance - :amt "
+    "WHERE vpa = :vpa AND balance >= :amt AND :amt >= :min "
+    "RETURNING balance"
+)
+_DEBIT_REJECT_SQL = text(
+    "SELECT CASE "
+    "WHEN NOT EXISTS (SELECT 1 FROM accounts WHERE vpa = :vpa) THEN 'PAYER_NOT_FOUND' "
+    "WHEN :amt < :min THEN 'MIN_AMOUNT_VIOLATION' "
+    "ELSE 'INSUFFICIENT_BALANCE' END"
+)
+
+
+def _match_prior(prior, vpa: str, amount: float) -> tuple[str, Optional[float]]:
+    """Outcome for a ReqPay whose msg_id already has debit_log row ``prior``."""
+    if prior.vpa == vpa and round(prior.amount, 2) == round(amount, 2):
+        return "DUPLICATE", prior.balance
+    return "MSG_ID_CONFLICT", None
+
+
+def recorded_debit(conn, vpa: str, amount: float, msg_id: str) -> tuple[str, Optional[float]]:
+    """
+    Outcome for ``msg_id`` from debit_log alone, after a concurrent request with the same msg_id
+    won the insert race: ("DUPLICATE", balance) if it debited the same ``vpa`` and ``amount``,
+    else ("MSG_ID_CONFLICT", None).
+    """
+    prior = conn.execute(_DEBIT_LOG_GET_SQL, {"msg_id": msg_id}).one_or_none()
+    if prior is None:
+        return "MSG_ID_CONFLICT", None
+    return _match_prior(prior, vpa.strip(), amount)
+
+
+def debit(
+    conn,
+    vpa: str,
+    amount: float,
+    min_amt: float,
+    msg_id: Optional[str] = None,
+    dedup_window_s: float = 60.0,
+) -> tuple[str, Optional[float]]:
+    """
+    Atomically debit ``amount`` from the account at ``vpa`` in one UPDATE ... RETURNING.
+    Returns ("SUCCESS", new_balance), ("DUPLICATE", balance_after_first_debit) if the same
+    (``msg_id``, ``vpa``, ``amount``) was applied within ``dedup_window_s`` seconds,
+    ("MSG_ID_CONFLICT", None) if ``msg_id`` was used for a different payer or amount in that
+    window, or (err_code, None) when no row was debited. Older entries are treated as unseen.
+    The caller owns the transaction (e.g. ``with engine.begin() as conn``); a concurrent
+    duplicate raises IntegrityError on the debit_log insert, which rolls the debit back;
+    resolve that with recorded_debit().
+    """
+    vpa = vpa.strip()
+    now = time.time()
+    prior = conn.execute(_DEBIT_LOG_GET_SQL, {"msg_id": msg_id}).one_or_none() if msg_id else None
+    if prior is not None and now - prior.created_at < dedup_window_s:
+        return _match_prior(prior, vpa, amount)
+    params = {"vpa": vpa, "amt": amount, "min": min_amt}
+    bal = conn.execute(_DEBIT_SQL, params).scalar_one_or_none()
+    if bal is None:
+        return conn.execute(_DEBIT_REJECT_SQL, params).scalar_one(), None
+    if msg_id:
+        if prior is not None:
+            # Expired entry for a reused msg_id; the new debit takes its place
+            conn.execute(_DEBIT_LOG_DEL_SQL, {"msg_id": msg_id})
+        conn.execute(_DEBIT_LOG_ADD_SQL, {**params, "msg_id": msg_id, "bal": bal, "now": now})
+    return "SUCCESS", bal
+
+
 def upsert_account(
     session: Session,
     *,
@@ -74,12 +185,35 @@ def upsert_account(
     return account
 
 
+_SAMPLE_ACCOUNTS = [
+    {"id": "SBI-ABHISHEK", "vpa": "abhishek@paytm", "name": "Abhishek", "bank_code": "SBI", "balance": 10000.00},
+    {"id": "SBI-AMAN", "vpa": "aman@paytm", "name": "Aman", "bank_code": "SBI", "balance": 15000.00},
+    {"id": "SBI-HARSH", "vpa": "harsh@paytm", "name": "Harsh", "bank_code": "SBI", "balance": 20000.00},
+]
+
+
 def seed_sample_accounts(session: Session) -> None:
-    """Insert accounts for Abhishek, Aman, Harsh (payer VPAs @paytm) at SBI. Balances match payment_ui PAYER_USERS."""
-    for account_id, vpa, name, balance in [
-        ("SBI-ABHISHEK", "abhishek@paytm", "Abhishek", 10000.00),
-        ("SBI-AMAN", "aman@paytm", "Aman", 15000.00),
-        ("SBI-HARSH", "harsh@paytm", "Harsh", 20000.00),
-    ]:
-        upsert_account(session, id=account_id, vpa=vpa, name=name, bank_code="SBI", balance=balance)
+    """
+    Insert accounts for Abhishek, Aman, Harsh (payer VPAs @paytm) at SBI. Balances match payment_ui PAYER_USERS.
+    Also resets debit_log: entries recorded against the old balances must not suppress new debits.
+    """
+    # Drop + create rather than DELETE so an older debit_log layout is replaced too
+    conn = session.connection()
+    DebitLog.__table__.drop(conn, checkfirst=True)
+    DebitLog.__table__.create(conn)
+    if session.get_bind().dialect.name == "sqlite":
+        # One multi-row upsert instead of a SELECT + INSERT/UPDATE per account
+        stmt = sqlite_insert(Account.__table__).values(_SAMPLE_ACCOUNTS)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Account.vpa],
+            set_={
+                "name": stmt.excluded.name,
+                "bank_code": stmt.excluded.bank_code,
+                "balance": stmt.excluded.balance,
+            },
+        )
+        session.execute(stmt)
+    else:
+        for row in _SAMPLE_ACCOUNTS:
+            upsert_account(session, **row)
     session.commit()
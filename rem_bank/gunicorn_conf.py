@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for rem_bank: gunicorn -c gunicorn_conf.py app:app
+"""
+import os
+
+# Resolve app:app (and the db package) from rem_bank/ whatever the launch directory
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+# One worker: agent status, the _idem replay cache and the manifest/status queues live in
+# process memory, so extra workers would each see only part of that state. Scale with threads.
+workers = int(os.getenv("WEB_WORKERS", "1"))
+threads = int(os.getenv("WEB_THREADS", "16"))
+worker_class = "gthread"
+# Import app (schema, engine, seed) once in the master; workers fork from it
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Connections opened by the master during startup must not be shared with the worker(s);
+    # drop them so each worker's pool opens its own.
+    import app
+
+    if app._engine is not None:
+        app._engine.dispose(close=False)
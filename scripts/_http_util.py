@@ -0,0 +1,172 @@
+"""
+HTTP and sample-cache helpers shared by the scripts/test_*.py runners.
+Imported as a sibling module: python scripts/test_reqpay.py puts scripts/ on sys.path.
+"""
+import http.client
+import json
+import os
+import random
+import re
+import select
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Host port at the end of `docker compose port` output, e.g. "0.0.0.0:5060"
+PORT_RE = re.compile(r":(\d+)\s*$")
+
+# docker compose port lookups cost a process spawn each; reuse them across runs for a minute
+_PORT_CACHE = os.path.join(tempfile.gettempdir(), "pheonix_ports.json")
+_PORT_CACHE_TTL = 60
+
+
+# Set once docker fails to start or times out, so the rest of the run skips docker instead of
+# paying the same failure (up to 5s each) for every lookup and the Step 5 log fetch
+_docker_unavailable = False
+
+
+def docker_available():
+    return not _docker_unavailable
+
+
+def docker_failed():
+    global _docker_unavailable
+    _docker_unavailable = True
+
+
+def compose_url(service, port, fallback):
+    """http://localhost:<host port> for a compose service, or fallback if docker can't say."""
+    key = f"{PROJECT_ROOT}:{service}:{port}"
+    try:
+        with open(_PORT_CACHE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    hit = cache.get(key)
+    if isinstance(hit, list) and len(hit) == 2 and time.time() - hit[1] < _PORT_CACHE_TTL:
+        return hit[0]
+    if not docker_available():
+        return fallback
+    try:
+        out = subprocess.run(
+            ["docker", "compose", "port", service, port],
+            capture_output=True,
+            text=True,
+            timeout=5,
+            cwd=PROJECT_ROOT,
+        )
+        m = PORT_RE.search(out.stdout) if out.returncode == 0 else None
+        if m:
+            url = f"http://localhost:{m.group(1)}"
+            cache[key] = [url, time.time()]
+            try:
+                tmp = f"{_PORT_CACHE}.{os.getpid()}"
+                with open(tmp, "w") as f:
+                    json.dump(cache, f)
+                os.replace(tmp, _PORT_CACHE)
+            except OSError:
+                pass
+            return url
+    except (FileNotFoundError, subprocess.TimeoutExpired, OSError):
+        docker_failed()
+    return fallback
+
+
+# Extracted sample fields, keyed by file identity, so unchanged samples skip the parse on later runs
+_PARAMS_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "pheonix", "params.json")
+
+
+def sample_params(path, body, extract, version):
+    """extract(body), reused from _PARAMS_CACHE while the file at path and the extractor version are unchanged."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return extract(body)
+    key = f"{extract.__name__}:v{version}:{path}:{st.st_mtime_ns}:{st.st_size}"
+    try:
+        with open(_PARAMS_CACHE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    params = cache.get(key)
+    if isinstance(params, dict):
+        return params
+    params = extract(body)
+    if params:
+        # Drop entries for older versions of this file or of the extractor
+        prefix, file_part = f"{extract.__name__}:", f":{path}:"
+        cache = {k: v for k, v in cache.items() if not (k.startswith(prefix) and file_part in k)}
+        cache[key] = params
+        try:
+            os.makedirs(os.path.dirname(_PARAMS_CACHE), exist_ok=True)
+            tmp = f"{_PARAMS_CACHE}.{os.getpid()}"
+            with open(tmp, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp, _PARAMS_CACHE)
+        except OSError:
+            pass
+    return params
+
+
+# Keep-alive connections, one per host:port; each has a lock since health probes may run in threads
+_CONNS = {}
+_CONNS_LOCK = threading.Lock()
+
+
+def request(method, url, body=None, headers=None, timeout=10):
+    """Send one request over a kept-alive connection to url's host. Returns (status, body)."""
+    parts = urllib.parse.urlsplit(url)
+    key = (parts.hostname, parts.port or 80)
+    path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+    with _CONNS_LOCK:
+        entry = _CONNS.get(key)
+        if entry is None:
+            entry = _CONNS[key] = (http.client.HTTPConnection(*key), threading.Lock())
+    conn, lock = entry
+    with lock:
+        # An idle kept-alive socket that reads as ready has been closed by the server (or holds junk):
+        # reconnect before sending, so nothing has to be resent
+        if conn.sock is not None and select.select([conn.sock], [], [], 0)[0]:
+            conn.close()
+        # A reused connection may have been closed by the server while idle: retry that once, but
+        # only for GET/HEAD. A POST may have been processed before the drop, so it is not resent.
+        for retry in (conn.sock is not None and method in ("GET", "HEAD"), False):
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                conn.request(method, path, body, headers or {})
+                resp = conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if not retry:
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+
+
+# Per-kind timeout budgets; jittered so looped runs against a shared stack don't time out in step
+_TIMEOUTS = {"health": 2.0, "post": 10.0}
+
+
+def _timeout(kind):
+    return _TIMEOUTS[kind] * random.uniform(0.9, 1.1)
+
+
+def send(method, url, body=None, headers=None, kind="post"):
+    """request() with a jittered timeout and one backed-off retry for transient failures."""
+    for attempt in range(2):
+        try:
+            return request(method, url, body, headers, timeout=_timeout(kind))
+        except OSError as e:
+            # GETs are safe to repeat; a POST only if the connection was refused (nothing sent)
+            if attempt or not (method == "GET" or isinstance(e, ConnectionRefusedError)):
+                raise
+            time.sleep(0.25 * random.uniform(0.8, 1.2))
@@ -13,6 +13,7 @@ Examples:
 from __future__ import annotations
 
 import argparse
+import functools
 import os
 import sys
 
@@ -20,8 +21,8 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
 sys.path.insert(0, PROJECT_ROOT)
 
-from bene_bank.db import Account as BeneAccount, get_account_by_vpa as bene_get_by_vpa, get_engine as bene_get_engine, make_session_factory as bene_make_session
-from rem_bank.db import Account as RemAccount, get_account_by_vpa as rem_get_by_vpa, get_engine as rem_get_engine, make_session_factory as rem_make_session
+# SQLAlchemy and the bank models are imported where used, so --help and
+# single-bank runs don't load the other bank's package.
 
 
 def _db_path(service: str, filename: str) -> str:
@@ -29,19 +30,32 @@ def _db_path(service: str, filename: str) -> str:
     return os.path.abspath(path).replace("\\", "/")
 
 
+def _sqlite_engine(url: str):
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import QueuePool
+
+    # One pooled connection per DB file: file handle and page cache survive across queries
+    return create_engine(
+        url,
+        echo=False,
+        future=True,
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        connect_args={"check_same_thread": False},
+    )
+
+
+@functools.lru_cache(maxsize=2)
 def _engine_and_session(service: str):
+    """Engine + session factory per service, built once (--db all queries both)."""
     if service == "bene_bank":
+        from bene_bank.db import Account, get_account_by_vpa as get_by_vpa, make_session_factory
         url = f"sqlite:///{_db_path('bene_bank', 'bene_bank.sqlite')}"
-        engine = bene_get_engine(db_url=url)
-        Session = bene_make_session(engine)
-        Account = BeneAccount
-        get_by_vpa = bene_get_by_vpa
     else:
+        from rem_bank.db import Account, get_account_by_vpa as get_by_vpa, make_session_factory
         url = f"sqlite:///{_db_path('rem_bank', 'rem_bank.sqlite')}"
-        engine = rem_get_engine(db_url=url)
-        Session = rem_make_session(engine)
-        Account = RemAccount
-        get_by_vpa = rem_get_by_vpa
+    Session = make_session_factory(_sqlite_engine(url))
     return Session, Account, get_by_vpa
 
 
@@ -56,11 +70,18 @@ def _format_account(acc, db_name: str) -> str:
     )
 
 
-def _query(session, Account, get_by_vpa, *, vpa: str | None = None, account_id: str | None = None):
+def _query(session, Account, get_by_vpa, *, vpa: str | None = None, account_id: str | None = None, lean: bool = True):
     if vpa:
         return get_by_vpa(session, vpa)
     if account_id:
         return session.query(Account).filter(Account.id == account_id).one_or_none()
+    if lean:
+        from sqlalchemy import select
+
+        # Plain Rows (attribute access works for _format_account); no ORM instances or identity map
+        return session.execute(
+            select(Account.id, Account.vpa, Account.name, Account.bank_code, Account.balance)
+        ).all()
     return session.query(Account).all()
 
 
@@ -2,20 +2,43 @@ import sqlite3
 import sys
 import os
 
-def get_balance(db_path, vpa):
+# Per-connection read tuning. journal_mode is left alone: it is persistent and owned by the services.
+_READ_PRAGMAS = "PRAGMA temp_store=memory; PRAGMA cache_size=-20000; PRAGMA busy_timeout=5000;"
+
+def _connect(db_path):
     if not os.path.exists(db_path):
         return None
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT balance FROM accounts WHERE vpa = ?", (vpa,))
-        row = cursor.fetchone()
-        conn.close()
-        return row[0] if row else None
+        # Autocommit: plain SELECTs need no implicit BEGIN
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        conn.executescript(_READ_PRAGMAS)
+        return conn
     except Exception as e:
         print(f"Error reading {db_path}: {e}")
         return None
 
+def get_balance(conn, vpa):
+    if conn is None:
+        return None
+    try:
+        row = conn.execute("SELECT balance FROM accounts WHERE vpa = ?", (vpa,)).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        print(f"Error reading balance for {vpa}: {e}")
+        return None
+
+def get_both_balances(conn, payer_vpa, payee_vpa):
+    """Both balances in one round-trip; bene_bank must be attached to conn as 'bene'."""
+    try:
+        return conn.execute(
+            "SELECT (SELECT balance FROM main.accounts WHERE vpa = ?), "
+            "(SELECT balance FROM bene.accounts WHERE vpa = ?)",
+            (payer_vpa, payee_vpa),
+        ).fetchone()
+    except Exception as e:
+        print(f"Error reading balances: {e}")
+        return None, None
+
 def main():
     rem_db = "rem_bank/rem_bank.sqlite"
     bene_db = "bene_bank/bene_bank.sqlite"
@@ -25,8 +48,21 @@ def main():
     
     print(f"Checking balances for {payer_vpa} and {payee_vpa}...")
     
-    payer_bal = get_balance(rem_db, payer_vpa)
-    payee_bal = get_balance(bene_db, payee_vpa)
+    rem_conn = _connect(rem_db)
+    bene_conn = None
+    try:
+        if rem_conn is not None and os.path.exists(bene_db):
+            # One connection, one query: bene_bank attached alongside rem_bank
+            rem_conn.execute("ATTACH DATABASE ? AS bene", (bene_db,))
+            payer_bal, payee_bal = get_both_balances(rem_conn, payer_vpa, payee_vpa)
+        else:
+            bene_conn = _connect(bene_db)
+            payer_bal = get_balance(rem_conn, payer_vpa)
+            payee_bal = get_balance(bene_conn, payee_vpa)
+    finally:
+        for conn in (rem_conn, bene_conn):
+            if conn is not None:
+                conn.close()
     
     print(f"Payer Balance (RemBank): {payer_bal}")
     print(f"Payee Balance (BeneBank): {payee_bal}")
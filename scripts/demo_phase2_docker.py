@@ -6,9 +6,12 @@ Demonstrates end-to-end flow via HTTP APIs.
 
 import json
 import logging
+import random
 import time
 import requests
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 logger = logging.getLogger(__name__)
@@ -19,6 +22,25 @@ REM_BANK_URL = "http://localhost:5080"
 BENE_BANK_URL = "http://localhost:5090"
 ORCHESTRATOR_URL = "http://localhost:5040"
 
+# Keep-alive connections shared by the health checks, manifest dispatch and polling loop
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=8))
+
+
+# Per-attempt timeouts for a health probe; a healthy service answers the first one
+_PROBE_LADDER = (0.5, 1.0, 2.0)
+
+
+def _probe(url):
+    """GET url, retrying with growing timeouts so a slow-starting service gets another chance."""
+    for i, timeout in enumerate(_PROBE_LADDER):
+        try:
+            return _SESSION.get(url, timeout=timeout)
+        except requests.RequestException:
+            if i + 1 == len(_PROBE_LADDER):
+                raise
+            time.sleep(timeout)
+
 
 def check_services():
     """Check if all services are running."""
@@ -33,18 +55,22 @@ def check_services():
     logger.info("Checking service health...")
     logger.info("=" * 80)
     
+    # Probe all services at once: a stalled one costs its own timeout, not everyone's
     all_healthy = True
-    for name, url in services.items():
-        try:
-            r = requests.get(url, timeout=5)
-            if r.status_code == 200:
-                logger.info(f"✓ {name}: OK")
-            else:
-                logger.error(f"✗ {name}: HTTP {r.status_code}")
+    with ThreadPoolExecutor(max_workers=len(services)) as pool:
+        futures = {pool.submit(_probe, url): name for name, url in services.items()}
+        for fut in as_completed(futures):
+            name = futures[fut]
+            try:
+                r = fut.result()
+                if r.status_code == 200:
+                    logger.info(f"✓ {name}: OK")
+                else:
+                    logger.error(f"✗ {name}: HTTP {r.status_code}")
+                    all_healthy = False
+            except requests.RequestException as e:
+                logger.error(f"✗ {name}: {e}")
                 all_healthy = False
-        except requests.RequestException as e:
-            logger.error(f"✗ {name}: {e}")
-            all_healthy = False
     
     logger.info("")
     return all_healthy
@@ -72,7 +98,7 @@ def create_and_dispatch_manifest():
     }
     
     try:
-        r = requests.post(
+        r = _SESSION.post(
             f"{NPCI_URL}/api/agent/create-manifest",
             json=manifest_data,
             timeout=30,
@@ -96,15 +122,15 @@ def create_and_dispatch_manifest():
         return None
 
 
-def poll_orchestrator(change_id, max_attempts=10, delay=2):
-    """Poll orchestrator for status updates."""
+def poll_orchestrator(change_id, max_attempts=10, delay=0.5, max_delay=8):
+    """Poll orchestrator for status updates, backing off exponentially (with jitter) between attempts."""
     logger.info("=" * 80)
     logger.info("Step 2: Polling orchestrator for status updates...")
     logger.info("=" * 80)
     
     for attempt in range(max_attempts):
         try:
-            r = requests.get(f"{ORCHESTRATOR_URL}/api/orchestrator/change/{change_id}", timeout=5)
+            r = _SESSION.get(f"{ORCHESTRATOR_URL}/api/orchestrator/change/{change_id}", timeout=5)
             if r.status_code == 200:
                 status_data = r.json()
                 logger.info(f"\nAttempt {attempt + 1}/{max_attempts}:")
@@ -114,23 +140,21 @@ def poll_orchestrator(change_id, max_attempts=10, delay=2):
                 for agent_id, status in status_data.get("statuses", {}).items():
                     logger.info(f"    {agent_id}: {status}")
                 
-                # Check if all agents are READY
+                # Check if all agents are READY (an empty status map means none have reported yet)
                 statuses = status_data.get("statuses", {})
-                if all(s == "READY" for s in statuses.values()):
+                if statuses and all(s == "READY" for s in statuses.values()):
                     logger.info("\n✓ All agents are READY!")
                     logger.info("")
                     return status_data
-                
-                time.sleep(delay)
             elif r.status_code == 404:
                 logger.warning(f"  Change {change_id} not found in orchestrator yet...")
-                time.sleep(delay)
             else:
                 logger.error(f"  HTTP {r.status_code}")
-                time.sleep(delay)
         except requests.RequestException as e:
             logger.warning(f"  Orchestrator unreachable: {e}")
-            time.sleep(delay)
+        if attempt + 1 < max_attempts:
+            # Poll quickly at first, then back off; jitter keeps repeated runs from syncing up
+            time.sleep(min(max_delay, delay * 2 ** attempt) * random.uniform(0.8, 1.2))
     
     logger.warning("\n⚠ Timeout waiting for all agents to be READY")
     logger.info("")
@@ -144,7 +168,7 @@ def get_summary():
     logger.info("=" * 80)
     
     try:
-        r = requests.get(f"{ORCHESTRATOR_URL}/api/orchestrator/summary", timeout=5)
+        r = _SESSION.get(f"{ORCHESTRATOR_URL}/api/orchestrator/summary", timeout=5)
         r.raise_for_status()
         summary = r.json()
         
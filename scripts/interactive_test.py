@@ -10,15 +10,16 @@ Usage:
 
 Requirements:
     - Docker containers must be running: docker-compose up -d
+    - requests (pip install requests)
 """
 
+import functools
 import os
 import sys
-import xml.etree.ElementTree as ET
 from datetime import datetime
-import urllib.request
-import urllib.error
-import subprocess
+from xml.sax.saxutils import escape
+
+from _http_util import PORT_RE
 
 # Configuration
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -30,15 +31,42 @@ DEFAULT_PAYER_VPA = "abhishek@paytm"
 DEFAULT_PAYEE_VPA = "abhishek@phonepe"
 
 
-def _qname(tag: str) -> str:
-    """Generate qualified XML tag name with namespace."""
-    return f"{{{NS}}}{tag}"
+@functools.lru_cache(maxsize=1)
+def _http():
+    """One keep-alive session for the health check and every transaction sent.
+    requests is imported here so importing this module (as test_interactive does) stays cheap."""
+    import requests
+
+    return requests.Session()
+
+
+# Fixed-shape ReqPay; same document ElementTree used to serialize for build_reqpay_xml
+_REQPAY_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    f'<ns0:ReqPay xmlns:ns0="{NS}">'
+    '<ns0:Head ver="2.0" ts="{ts}" orgId="PAYER_PSP" msgId="{msg_id}" prodType="UPI" />'
+    '<ns0:Txn id="{txn_id}" type="PAY" custRef="Payment from {payer}" />'
+    '<ns0:Payer addr="{payer}" name="Alice" type="PERSON">'
+    '<ns0:Creds><ns0:Cred type="PIN"><ns0:Data>{pin}</ns0:Data></ns0:Cred></ns0:Creds>'
+    '<ns0:Amount value="{amount:.2f}" curr="INR" />'
+    '</ns0:Payer>'
+    '<ns0:Payees><ns0:Payee addr="{payee}" name="Bob" type="PERSON" /></ns0:Payees>'
+    '</ns0:ReqPay>'
+)
 
 
+def _attr(value: str) -> str:
+    """Escape a value for a double-quoted XML attribute."""
+    return escape(value, {'"': "&quot;"})
+
+
+@functools.lru_cache(maxsize=1)
 def _detect_payer_psp_url():
-    """Auto-detect Payer PSP URL from docker-compose or environment."""
+    """Auto-detect Payer PSP URL from docker-compose or environment (once per process)."""
     if os.environ.get("PAYER_PSP_URL"):
         return os.environ["PAYER_PSP_URL"]
+    import subprocess
+
     try:
         out = subprocess.run(
             ["docker", "compose", "port", "payer_psp", "5004"],  # Internal port is 5004
@@ -47,10 +75,9 @@ def _detect_payer_psp_url():
             timeout=5,
             cwd=PROJECT_ROOT,
         )
-        if out.returncode == 0 and out.stdout.strip():
-            port = out.stdout.strip().split(":")[-1]
-            if port.isdigit():
-                return f"http://localhost:{port}"
+        m = PORT_RE.search(out.stdout) if out.returncode == 0 else None
+        if m:
+            return f"http://localhost:{m.group(1)}"
     except (FileNotFoundError, subprocess.TimeoutExpired, OSError):
         pass
     return "http://localhost:5060"  # Default from .env PAYER_PSP_PORT
@@ -69,77 +96,48 @@ def build_reqpay_xml(payer_vpa: str, payee_vpa: str, amount: float, pin: str = "
     Returns:
         XML bytes ready to send
     """
-    ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    txn_id = f"TXN{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-    msg_id = f"MSG{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-    
-    root = ET.Element(_qname("ReqPay"))
-    
-    # Head
-    head = ET.SubElement(root, _qname("Head"))
-    head.set("ver", "2.0")
-    head.set("ts", ts)
-    head.set("orgId", "PAYER_PSP")
-    head.set("msgId", msg_id)
-    head.set("prodType", "UPI")
-    
-    # Txn
-    txn = ET.SubElement(root, _qname("Txn"))
-    txn.set("id", txn_id)
-    txn.set("type", "PAY")
-    txn.set("custRef", f"Payment from {payer_vpa}")
-    
-    # Payer
-    payer = ET.SubElement(root, _qname("Payer"))
-    payer.set("addr", payer_vpa)
-    payer.set("name", "Alice")
-    payer.set("type", "PERSON")
-    
-    # Payer Creds (PIN)
-    creds = ET.SubElement(payer, _qname("Creds"))
-    cred = ET.SubElement(creds, _qname("Cred"))
-    cred.set("type", "PIN")
-    data = ET.SubElement(cred, _qname("Data"))
-    data.text = pin
-    
-    # Payer Amount
-    payer_amt = ET.SubElement(payer, _qname("Amount"))
-    payer_amt.set("value", f"{amount:.2f}")
-    payer_amt.set("curr", "INR")
-    
-    # Payees
-    payees = ET.SubElement(root, _qname("Payees"))
-    payee = ET.SubElement(payees, _qname("Payee"))
-    payee.set("addr", payee_vpa)
-    payee.set("name", "Bob")
-    payee.set("type", "PERSON")
+    # One clock read so ts, txn_id and msg_id always agree; microseconds keep ids
+    # unique when messages are built back to back (test_interactive prebuilds the next one)
+    now = datetime.utcnow()
+    ts = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    stamp = now.strftime("%Y%m%d%H%M%S%f")
+    txn_id = f"TXN{stamp}"
+    msg_id = f"MSG{stamp}"
     
-    xml_str = ET.tostring(root, encoding="unicode", method="xml")
-    return ('<?xml version="1.0" encoding="UTF-8"?>\n' + xml_str).encode("utf-8")
+    return _REQPAY_TEMPLATE.format(
+        ts=ts,
+        msg_id=msg_id,
+        txn_id=txn_id,
+        payer=_attr(payer_vpa),
+        pin=escape(pin),
+        amount=amount,
+        payee=_attr(payee_vpa),
+    ).encode("utf-8")
 
 
-def send_transaction(payer_vpa: str, payee_vpa: str, amount: float, pin: str) -> dict:
+def send_transaction(payer_vpa: str, payee_vpa: str, amount: float, pin: str, xml_body: bytes | None = None) -> dict:
     """
     Send a UPI transaction and return the result.
     
+    xml_body, if given, is a ReqPay already built with build_reqpay_xml for these arguments.
+    
     Returns:
         dict with keys: success (bool), status_code (int), message (str), details (str)
     """
     payer_psp_url = _detect_payer_psp_url()
     url = f"{payer_psp_url.rstrip('/')}/api/reqpay"
     
-    # Build XML
-    xml_body = build_reqpay_xml(payer_vpa, payee_vpa, amount, pin)
+    # Build XML (unless the caller built it ahead of time)
+    if xml_body is None:
+        xml_body = build_reqpay_xml(payer_vpa, payee_vpa, amount, pin)
     
     # Send request
-    req = urllib.request.Request(url, data=xml_body, method="POST")
-    req.add_header("Content-Type", "application/xml")
-    
+    import requests
+
     try:
-        with urllib.request.urlopen(req, timeout=10) as r:
-            response_data = r.read()
-            status_code = r.status
-            response_text = response_data.decode("utf-8", errors="replace")
+        r = _http().post(url, data=xml_body, headers={"Content-Type": "application/xml"}, timeout=10)
+        status_code = r.status_code
+        response_text = r.text
         
         if status_code == 202:
             return {
@@ -148,6 +146,13 @@ def send_transaction(payer_vpa: str, payee_vpa: str, amount: float, pin: str) ->
                 "message": "Transaction accepted and processed",
                 "details": response_text
             }
+        elif status_code >= 400:
+            return {
+                "success": False,
+                "status_code": status_code,
+                "message": f"HTTP Error {status_code}",
+                "details": response_text
+            }
         else:
             return {
                 "success": False,
@@ -156,21 +161,11 @@ def send_transaction(payer_vpa: str, payee_vpa: str, amount: float, pin: str) ->
                 "details": response_text
             }
     
-    except urllib.error.HTTPError as e:
-        response_data = e.read()
-        response_text = response_data.decode("utf-8", errors="replace")
-        return {
-            "success": False,
-            "status_code": e.code,
-            "message": f"HTTP Error {e.code}",
-            "details": response_text
-        }
-    
-    except urllib.error.URLError as e:
+    except requests.ConnectionError as e:
         return {
             "success": False,
             "status_code": 0,
-            "message": f"Connection failed: {e.reason}",
+            "message": f"Connection failed: {e}",
             "details": "Make sure Docker containers are running: docker-compose up -d"
         }
     
@@ -189,13 +184,13 @@ def check_services():
     
     print("Checking services...")
     try:
-        with urllib.request.urlopen(f"{payer_psp_url.rstrip('/')}/health", timeout=2) as r:
-            if r.status == 200:
-                print(f"✓ Payer PSP is running at {payer_psp_url}")
-                return True
-            else:
-                print(f"✗ Payer PSP health check failed (HTTP {r.status})")
-                return False
+        r = _http().get(f"{payer_psp_url.rstrip('/')}/health", timeout=2)
+        if r.status_code == 200:
+            print(f"✓ Payer PSP is running at {payer_psp_url}")
+            return True
+        else:
+            print(f"✗ Payer PSP health check failed (HTTP {r.status_code})")
+            return False
     except Exception as e:
         print(f"✗ Cannot reach Payer PSP at {payer_psp_url}")
         print(f"  Error: {e}")
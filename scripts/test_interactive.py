@@ -10,15 +10,32 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from scripts.interactive_test import send_transaction, check_services, DEFAULT_PAYER_VPA, DEFAULT_PAYEE_VPA
+from concurrent.futures import ThreadPoolExecutor
 
-def test_transaction(amount, expected_success=True):
-    """Test a single transaction."""
+from scripts.interactive_test import (
+    build_reqpay_xml,
+    send_transaction,
+    check_services,
+    DEFAULT_PAYER_VPA,
+    DEFAULT_PAYEE_VPA,
+)
+
+# (amount, expected_success), run in order
+CASES = [
+    # Amount below minimum (should fail if validation is active)
+    # Note: This might succeed if the minimum validation hasn't been deployed yet
+    (0.50, False),
+    # Amount at minimum (should succeed)
+    (1.00, True),
+    # Amount above minimum (should succeed)
+    (10.00, True),
+]
+
+def _print_header(amount):
     print(f"\nTesting transaction: ₹{amount:.2f}")
     print("-" * 50)
-    
-    result = send_transaction(DEFAULT_PAYER_VPA, DEFAULT_PAYEE_VPA, amount, "1234")
-    
+
+def _check_result(result, expected_success):
     if result["success"] == expected_success:
         print(f"✓ PASS: Transaction {'succeeded' if expected_success else 'failed'} as expected")
         print(f"  Status: {result['message']}")
@@ -29,6 +46,12 @@ def test_transaction(amount, expected_success=True):
         print(f"  Details: {result['details']}")
         return False
 
+def test_transaction(amount, expected_success=True):
+    """Test a single transaction."""
+    _print_header(amount)
+    result = send_transaction(DEFAULT_PAYER_VPA, DEFAULT_PAYEE_VPA, amount, "1234")
+    return _check_result(result, expected_success)
+
 def main():
     print("=" * 70)
     print("  Automated Test for UPI Transaction Script")
@@ -48,21 +71,20 @@ def main():
     tests_passed = 0
     tests_total = 0
     
-    # Test 1: Amount below minimum (should fail if validation is active)
-    # Note: This might succeed if the minimum validation hasn't been deployed yet
-    tests_total += 1
-    if test_transaction(0.50, expected_success=False):
-        tests_passed += 1
-    
-    # Test 2: Amount at minimum (should succeed)
-    tests_total += 1
-    if test_transaction(1.00, expected_success=True):
-        tests_passed += 1
-    
-    # Test 3: Amount above minimum (should succeed)
-    tests_total += 1
-    if test_transaction(10.00, expected_success=True):
-        tests_passed += 1
+    # Transactions still go out one at a time and are checked in order; the next
+    # ReqPay is built while the current one is in flight.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        xml_body = build_reqpay_xml(DEFAULT_PAYER_VPA, DEFAULT_PAYEE_VPA, CASES[0][0], "1234")
+        for i, (amount, expected_success) in enumerate(CASES):
+            tests_total += 1
+            _print_header(amount)
+            future = pool.submit(
+                send_transaction, DEFAULT_PAYER_VPA, DEFAULT_PAYEE_VPA, amount, "1234", xml_body
+            )
+            if i + 1 < len(CASES):
+                xml_body = build_reqpay_xml(DEFAULT_PAYER_VPA, DEFAULT_PAYEE_VPA, CASES[i + 1][0], "1234")
+            if _check_result(future.result(), expected_success):
+                tests_passed += 1
     
     # Summary
     print("\n" + "=" * 70)
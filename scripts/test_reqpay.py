@@ -7,114 +7,158 @@ Run with: python scripts/test_reqpay.py
 Requires: docker compose up -d npci payer_psp rem_bank bene_bank
 Override: PAYER_PSP_URL=http://localhost:5060
 """
+import functools
+import http.client
+import io
 import os
+import re
 import subprocess
 import sys
-import urllib.error
-import urllib.request
-import xml.etree.ElementTree as ET
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from lxml import etree as ET  # C parser; same fromstring/find/get API used below
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+from _http_util import PROJECT_ROOT, compose_url, docker_available, docker_failed, sample_params, send
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
 SAMPLE_XML = os.path.join(SCRIPT_DIR, "sample_reqpay.xml")
 NS = "http://npci.org/upi/schema/"
 
+# Qualified tags for the extractor; all are direct children of their parent element
+_T_HEAD = f"{{{NS}}}Head"
+_T_TXN = f"{{{NS}}}Txn"
+_T_PAYER = f"{{{NS}}}Payer"
+_T_PAYEES = f"{{{NS}}}Payees"
+_T_PAYEE = f"{{{NS}}}Payee"
+_T_AMOUNT = f"{{{NS}}}Amount"
 
+
+@functools.lru_cache(maxsize=1)
 def _detect_payer_psp_url():
     if os.environ.get("PAYER_PSP_URL"):
         return os.environ["PAYER_PSP_URL"]
-    try:
-        out = subprocess.run(
-            ["docker", "compose", "port", "payer_psp", "5000"],
-            capture_output=True,
-            text=True,
-            timeout=5,
-            cwd=PROJECT_ROOT,
-        )
-        if out.returncode == 0 and out.stdout.strip():
-            port = out.stdout.strip().split(":")[-1]
-            if port.isdigit():
-                return f"http://localhost:{port}"
-    except (FileNotFoundError, subprocess.TimeoutExpired, OSError):
-        pass
-    return "http://localhost:5004"
+    return compose_url("payer_psp", "5000", "http://localhost:5004")
 
 
+@functools.lru_cache(maxsize=1)
 def _detect_rem_bank_url():
     if os.environ.get("REM_BANK_URL"):
         return os.environ["REM_BANK_URL"]
-    try:
-        out = subprocess.run(
-            ["docker", "compose", "port", "rem_bank", "5000"],
-            capture_output=True,
-            text=True,
-            timeout=5,
-            cwd=PROJECT_ROOT,
-        )
-        if out.returncode == 0 and out.stdout.strip():
-            port = out.stdout.strip().split(":")[-1]
-            if port.isdigit():
-                return f"http://localhost:{port}"
-    except (FileNotFoundError, subprocess.TimeoutExpired, OSError):
-        pass
-    return "http://localhost:5005"
+    return compose_url("rem_bank", "5000", "http://localhost:5005")
 
 
+@functools.lru_cache(maxsize=1)
 def _detect_bene_bank_url():
     if os.environ.get("BENE_BANK_URL"):
         return os.environ["BENE_BANK_URL"]
-    try:
-        out = subprocess.run(
-            ["docker", "compose", "port", "bene_bank", "5000"],
-            capture_output=True,
-            text=True,
-            timeout=5,
-            cwd=PROJECT_ROOT,
-        )
-        if out.returncode == 0 and out.stdout.strip():
-            port = out.stdout.strip().split(":")[-1]
-            if port.isdigit():
-                return f"http://localhost:{port}"
-    except (FileNotFoundError, subprocess.TimeoutExpired, OSError):
-        pass
-    return "http://localhost:5001"
+    return compose_url("bene_bank", "5000", "http://localhost:5001")
+
+
+# Part of the params cache key; bump whenever _extract_reqpay_params changes what it returns
+_PARAMS_VERSION = 1
 
 
 def _extract_reqpay_params(body: bytes) -> dict:
     """Extract key fields from ReqPay XML for display. Returns {} on parse error."""
     out = {}
+    # Stream the document and stop at the first Payee; nothing after it is ever built.
+    # open_tags tracks the current element path so lookups stay direct-child only.
+    open_tags = []
     try:
-        root = ET.fromstring(body)
-        q = lambda n: f".//{{{NS}}}{n}"
-        h = root.find(q("Head"))
-        t = root.find(q("Txn"))
-        p = root.find(q("Payer"))
-        payees = root.find(q("Payees"))
-        if h is not None:
-            out["Head.msgId"] = h.get("msgId", "")
-            out["Head.orgId"] = h.get("orgId", "")
-            out["Head.ver"] = h.get("ver", "")
-        if t is not None:
-            out["Txn.id"] = t.get("id", "")
-            out["Txn.type"] = t.get("type", "")
-        if p is not None:
-            out["Payer.addr"] = p.get("addr", "")
-            amt = p.find(q("Amount"))
-            if amt is not None:
-                out["Amount.value"] = amt.get("value", "")
-                out["Amount.curr"] = amt.get("curr", "INR")
-        if payees is not None:
-            pe = payees.find(q("Payee"))
-            if pe is not None:
-                out["Payee.addr"] = pe.get("addr", "")
+        for event, el in ET.iterparse(io.BytesIO(body), events=("start", "end")):
+            if event == "end":
+                open_tags.pop()
+                el.clear()
+                continue
+            open_tags.append(el.tag)
+            if len(open_tags) == 2:
+                if el.tag == _T_HEAD:
+                    out["Head.msgId"] = el.get("msgId", "")
+                    out["Head.orgId"] = el.get("orgId", "")
+                    out["Head.ver"] = el.get("ver", "")
+                elif el.tag == _T_TXN:
+                    out["Txn.id"] = el.get("id", "")
+                    out["Txn.type"] = el.get("type", "")
+                elif el.tag == _T_PAYER:
+                    out["Payer.addr"] = el.get("addr", "")
+            elif len(open_tags) == 3:
+                if open_tags[1] == _T_PAYER and el.tag == _T_AMOUNT:
+                    out["Amount.value"] = el.get("value", "")
+                    out["Amount.curr"] = el.get("curr", "INR")
+                elif open_tags[1] == _T_PAYEES and el.tag == _T_PAYEE:
+                    out["Payee.addr"] = el.get("addr", "")
+                    break
     except ET.ParseError:
-        pass
+        return {}
     return out
 
 
-PAYER_PSP = _detect_payer_psp_url()
-REM_BANK = _detect_rem_bank_url()
-BENE_BANK = _detect_bene_bank_url()
+# Step 5: lines worth echoing from docker compose logs, and the markers of a complete flow
+_LOG_LINE = re.compile(r"\[(?:NPCI|rem_bank|bene_bank|payer_psp)\]|Forwarding|Received|CREDIT|RespPay|final")
+# Named so one alternation pass over a line can report which markers it carries
+_FLOW_MARKERS = {
+    "npci_forward": "[NPCI] Forwarding",
+    "npci_rem_bank": "[NPCI] rem_bank",
+    "npci_bene_bank": "[NPCI] bene_bank",
+    "npci_credit": "[NPCI] Received RespPay CREDIT",
+    "npci_final": "[NPCI] Sending final RespPay",
+    "rem_bank_received": "[rem_bank] Received",
+    "bene_bank_received": "[bene_bank] Received",
+    "bene_bank_credit": "[bene_bank] RespPay CREDIT sent",
+    "payer_psp_final": "[payer_psp] Received final RespPay",
+}
+_FLOW_MARKER_RE = re.compile("|".join(f"(?P<{k}>{re.escape(v)})" for k, v in _FLOW_MARKERS.items()))
+
+
+def _print_flow_logs():
+    """Echo the relevant docker compose log lines, stopping once the whole flow has been seen."""
+    try:
+        proc = subprocess.Popen(
+            ["docker", "compose", "logs", "--tail=50", "npci", "rem_bank", "bene_bank", "payer_psp"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            cwd=PROJECT_ROOT,
+        )
+    except OSError:
+        docker_failed()
+        print("  Run: docker compose logs npci rem_bank bene_bank payer_psp")
+        return
+    # Filter as lines arrive; stop reading once every flow marker has shown up
+    killer = threading.Timer(10, proc.kill)
+    killer.start()
+    seen = set()
+    try:
+        for line in proc.stdout:
+            if _LOG_LINE.search(line):
+                print("  " + line.rstrip("\n"))
+                seen.update(m.lastgroup for m in _FLOW_MARKER_RE.finditer(line))
+                if len(seen) == len(_FLOW_MARKERS):
+                    break
+    finally:
+        killer.cancel()
+        if proc.poll() is None:
+            proc.terminate()
+        proc.stdout.close()
+        proc.wait()
+    if len(seen) != len(_FLOW_MARKERS) and proc.returncode != 0:
+        print("  Run: docker compose logs npci rem_bank bene_bank payer_psp")
+    elif not seen:
+        print("  (no relevant log lines in --tail=50; run: docker compose logs npci rem_bank bene_bank payer_psp)")
+
+
+def _probe(name, url):
+    """GET <url>/health; returns (name, status, error)."""
+    try:
+        status, _ = send("GET", f"{url.rstrip('/')}/health", kind="health")
+        return name, status, None
+    except Exception as e:
+        return name, None, e
 
 
 def main():
@@ -125,44 +169,36 @@ def main():
     print("=" * 60)
     print()
 
+    # Resolved here rather than at import, so importing this module never shells out to docker
+    payer_psp = _detect_payer_psp_url()
+    rem_bank = _detect_rem_bank_url()
+    bene_bank = _detect_bene_bank_url()
+
     # --- Parameters ---
     print("[Parameters]")
-    print(f"  Payer PSP URL  : {PAYER_PSP}")
-    print(f"  rem_bank URL   : {REM_BANK}")
-    print(f"  bene_bank URL  : {BENE_BANK}")
+    print(f"  Payer PSP URL  : {payer_psp}")
+    print(f"  rem_bank URL   : {rem_bank}")
+    print(f"  bene_bank URL  : {bene_bank}")
     print(f"  Sample file    : {SAMPLE_XML}")
-    print(f"  Endpoint       : {PAYER_PSP.rstrip('/')}/api/reqpay")
+    print(f"  Endpoint       : {payer_psp.rstrip('/')}/api/reqpay")
     print(f"  Content-Type   : application/xml")
     print()
 
     # --- Step 1: Health ---
     print("[Step 1/5] Checking Payer PSP, rem_bank, and bene_bank health...")
-    try:
-        with urllib.request.urlopen(f"{PAYER_PSP.rstrip('/')}/health", timeout=2) as r:
-            if r.status == 200:
-                print("  -> Payer PSP is up (HTTP 200).")
-            else:
-                print(f"  -> [WARN] Payer PSP /health returned {r.status}.")
-    except Exception as e:
-        print(f"  -> [WARN] Payer PSP not reachable: {e}")
-    try:
-        with urllib.request.urlopen(f"{REM_BANK.rstrip('/')}/health", timeout=2) as r:
-            if r.status == 200:
-                print("  -> rem_bank is up (HTTP 200).")
-            else:
-                print(f"  -> [WARN] rem_bank /health returned {r.status}.")
-    except Exception as e:
-        print(f"  -> [WARN] rem_bank not reachable: {e}")
-        print("     Start: docker compose up -d npci payer_psp rem_bank bene_bank")
-    try:
-        with urllib.request.urlopen(f"{BENE_BANK.rstrip('/')}/health", timeout=2) as r:
-            if r.status == 200:
-                print("  -> bene_bank is up (HTTP 200).")
-            else:
-                print(f"  -> [WARN] bene_bank /health returned {r.status}.")
-    except Exception as e:
-        print(f"  -> [WARN] bene_bank not reachable: {e}")
-        print("     Start: docker compose up -d npci payer_psp rem_bank bene_bank")
+    targets = [("Payer PSP", payer_psp), ("rem_bank", rem_bank), ("bene_bank", bene_bank)]
+    # Probe concurrently (worst case is one timeout, not three), report in fixed order
+    with ThreadPoolExecutor(max_workers=len(targets)) as ex:
+        results = list(ex.map(lambda nu: _probe(*nu), targets))
+    for name, status, err in results:
+        if err is not None:
+            print(f"  -> [WARN] {name} not reachable: {err}")
+            if name != "Payer PSP":
+                print("     Start: docker compose up -d npci payer_psp rem_bank bene_bank")
+        elif status == 200:
+            print(f"  -> {name} is up (HTTP 200).")
+        else:
+            print(f"  -> [WARN] {name} /health returned {status}.")
     print()
 
     # --- Step 2: Load sample ---
@@ -170,11 +206,10 @@ def main():
     if not os.path.isfile(SAMPLE_XML):
         print(f"  -> ERROR: File not found: {SAMPLE_XML}")
         sys.exit(1)
-    with open(SAMPLE_XML, "rb") as f:
-        body = f.read()
+    body = Path(SAMPLE_XML).read_bytes()
     n = len(body)
     print(f"  -> Loaded {n} bytes from {os.path.basename(SAMPLE_XML)}.")
-    params = _extract_reqpay_params(body)
+    params = sample_params(SAMPLE_XML, body, _extract_reqpay_params, _PARAMS_VERSION)
     if params:
         print("  -> Request parameters (from sample):")
         for k, v in params.items():
@@ -183,31 +218,27 @@ def main():
     print()
 
     # --- Step 3: POST ---
-    url = f"{PAYER_PSP.rstrip('/')}/api/reqpay"
+    url = f"{payer_psp.rstrip('/')}/api/reqpay"
     print(f"[Step 3/5] Sending POST /api/reqpay to Payer PSP URL {url}\n")
-    req = urllib.request.Request(url, data=body, method="POST")
-    req.add_header("Content-Type", "application/xml")
     try:
-        with urllib.request.urlopen(req, timeout=10) as r:
-            data = r.read()
-            status = r.status
-        print(f"  -> Response: HTTP {status}.")
-    except urllib.error.HTTPError as e:
-        data = e.read()
-        status = e.code
+        status, data = send("POST", url, body, {"Content-Type": "application/xml"})
+    except (OSError, http.client.HTTPException) as e:
+        print(f"  -> Request failed: {e}")
+        print(f"  -> Tried: {url}")
+        print("  1. Start: docker compose up -d npci payer_psp rem_bank bene_bank")
+        print("  2. Override: PAYER_PSP_URL=http://localhost:5060 python scripts/test_reqpay.py")
+        sys.exit(1)
+    # Decode the body once; every message below prints this text
+    text = data.decode("utf-8", errors="replace")
+    if status >= 400:
         print(f"  -> HTTP {status}")
-        print(data.decode("utf-8", errors="replace"))
+        print(text)
         if status == 404:
             print("\n  If you see 404: rebuild and restart:")
             print("    docker compose build npci payer_psp rem_bank bene_bank")
             print("    docker compose up -d npci payer_psp rem_bank bene_bank")
         sys.exit(1)
-    except urllib.error.URLError as e:
-        print(f"  -> Request failed: {e}")
-        print(f"  -> Tried: {url}")
-        print("  1. Start: docker compose up -d npci payer_psp rem_bank bene_bank")
-        print("  2. Override: PAYER_PSP_URL=http://localhost:5060 python scripts/test_reqpay.py")
-        sys.exit(1)
+    print(f"  -> Response: HTTP {status}.")
     print()
 
     # --- Step 4: Validate response ---
@@ -215,10 +246,9 @@ def main():
     if status != 202:
         print(f"  -> FAIL: expected HTTP 202 Accepted, got {status}.")
         print("  -> Response body:")
-        print(data.decode("utf-8", errors="replace"))
+        print(text)
         sys.exit(1)
-    text = data.decode("utf-8", errors="replace")
-    if "accepted" not in text.lower():
+    if b"accepted" not in data.lower():
         print("  -> FAIL: expected body to contain 'accepted'.")
         print("  -> Response body:", text)
         sys.exit(1)
@@ -227,38 +257,10 @@ def main():
 
     # --- Step 5: Show full flow from docker logs (rem_bank, bene_bank, NPCI->Payer PSP final RespPay) ---
     print("[Step 5/5] Full flow: rem_bank, bene_bank, NPCI->Payer PSP (final RespPay) [docker logs]:")
-    try:
-        out = subprocess.run(
-            ["docker", "compose", "logs", "--tail=50", "npci", "rem_bank", "bene_bank", "payer_psp"],
-            capture_output=True,
-            text=True,
-            timeout=10,
-            cwd=PROJECT_ROOT,
-        )
-        if out.returncode == 0 and (out.stdout or out.stderr):
-            log = (out.stdout or "") + (out.stderr or "")
-            for line in log.splitlines():
-                if "[NPCI]" in line or "[rem_bank]" in line or "[bene_bank]" in line or "[payer_psp]" in line or "Forwarding" in line or "Received" in line or "CREDIT" in line or "RespPay" in line or "final" in line:
-                    print("  " + line)
-            if not any(
-                x in log
-                for x in (
-                    "[NPCI] Forwarding",
-                    "[NPCI] rem_bank",
-                    "[NPCI] bene_bank",
-                    "[NPCI] Received RespPay CREDIT",
-                    "[NPCI] Sending final RespPay",
-                    "[rem_bank] Received",
-                    "[bene_bank] Received",
-                    "[bene_bank] RespPay CREDIT sent",
-                    "[payer_psp] Received final RespPay",
-                )
-            ):
-                print("  (no relevant log lines in --tail=50; run: docker compose logs npci rem_bank bene_bank payer_psp)")
-        else:
-            print("  Run: docker compose logs npci rem_bank bene_bank payer_psp")
-    except (FileNotFoundError, subprocess.TimeoutExpired, OSError):
+    if not docker_available():
         print("  Run: docker compose logs npci rem_bank bene_bank payer_psp")
+    else:
+        _print_flow_logs()
 
     # --- Result ---
     print()
@@ -5,66 +5,71 @@ Run with: python scripts/test_reqvaladd.py
 Requires: docker compose up -d npci payee_psp payer_psp
 Override: PAYER_PSP_URL=http://localhost:5060
 """
+import functools
+import http.client
+import io
 import os
-import subprocess
 import sys
-import urllib.error
-import urllib.request
-import xml.etree.ElementTree as ET
+from pathlib import Path
+
+try:
+    from lxml import etree as ET  # C parser; same fromstring/find/get API used below
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+from _http_util import compose_url, sample_params, send
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
 SAMPLE_XML = os.path.join(SCRIPT_DIR, "sample_reqvaladd.xml")
 NS = "http://npci.org/upi/schema/"
 
+# Qualified tags for the extractor; all are direct children of the root
+_T_HEAD = f"{{{NS}}}Head"
+_T_TXN = f"{{{NS}}}Txn"
+_T_PAYEE = f"{{{NS}}}Payee"
+
 
+@functools.lru_cache(maxsize=1)
 def _detect_payer_psp_url():
     if os.environ.get("PAYER_PSP_URL"):
         return os.environ["PAYER_PSP_URL"]
-    try:
-        out = subprocess.run(
-            ["docker", "compose", "port", "payer_psp", "5000"],
-            capture_output=True,
-            text=True,
-            timeout=5,
-            cwd=PROJECT_ROOT,
-        )
-        if out.returncode == 0 and out.stdout.strip():
-            port = out.stdout.strip().split(":")[-1]
-            if port.isdigit():
-                return f"http://localhost:{port}"
-    except (FileNotFoundError, subprocess.TimeoutExpired, OSError):
-        pass
-    return "http://localhost:5004"
+    return compose_url("payer_psp", "5000", "http://localhost:5004")
+
+
+# Part of the params cache key; bump whenever _extract_reqvaladd_params changes what it returns
+_PARAMS_VERSION = 1
 
 
 def _extract_reqvaladd_params(body: bytes) -> dict:
     """Extract key fields from ReqValAdd XML for display. Returns {} on parse error."""
     out = {}
+    # Stream the root's children and stop at Payee, the last one needed
+    depth = 0
     try:
-        root = ET.fromstring(body)
-        q = lambda n: f".//{{{NS}}}{n}"
-        h = root.find(q("Head"))
-        t = root.find(q("Txn"))
-        payee = root.find(q("Payee"))
-        if h is not None:
-            out["Head.msgId"] = h.get("msgId", "")
-            out["Head.orgId"] = h.get("orgId", "")
-            out["Head.ver"] = h.get("ver", "")
-        if t is not None:
-            out["Txn.id"] = t.get("id", "")
-            out["Txn.type"] = t.get("type", "")
-        if payee is not None:
-            out["Payee.addr"] = payee.get("addr", "")
-            out["Payee.name"] = payee.get("name", "")
+        for event, el in ET.iterparse(io.BytesIO(body), events=("start", "end")):
+            if event == "end":
+                depth -= 1
+                el.clear()
+                continue
+            depth += 1
+            if depth != 2:
+                continue
+            if el.tag == _T_HEAD:
+                out["Head.msgId"] = el.get("msgId", "")
+                out["Head.orgId"] = el.get("orgId", "")
+                out["Head.ver"] = el.get("ver", "")
+            elif el.tag == _T_TXN:
+                out["Txn.id"] = el.get("id", "")
+                out["Txn.type"] = el.get("type", "")
+            elif el.tag == _T_PAYEE:
+                out["Payee.addr"] = el.get("addr", "")
+                out["Payee.name"] = el.get("name", "")
+                break
     except ET.ParseError:
-        pass
+        return {}
     return out
 
 
-PAYER_PSP = _detect_payer_psp_url()
-
-
 def main():
     print("=" * 60)
     print("  ReqValAdd Test: Payer PSP -> NPCI -> Payee PSP")
@@ -73,22 +78,25 @@ def main():
     print("=" * 60)
     print()
 
+    # Resolved here rather than at import, so importing this module never shells out to docker
+    payer_psp = _detect_payer_psp_url()
+
     # --- Parameters ---
     print("[Parameters]")
-    print(f"  Payer PSP URL  : {PAYER_PSP}")
+    print(f"  Payer PSP URL  : {payer_psp}")
     print(f"  Sample file    : {SAMPLE_XML}")
-    print(f"  Endpoint       : {PAYER_PSP.rstrip('/')}/api/reqvaladd")
+    print(f"  Endpoint       : {payer_psp.rstrip('/')}/api/reqvaladd")
     print(f"  Content-Type   : application/xml")
     print()
 
     # --- Step 1: Health ---
     print("[Step 1/4] Checking Payer PSP health...")
     try:
-        with urllib.request.urlopen(f"{PAYER_PSP.rstrip('/')}/health", timeout=2) as r:
-            if r.status == 200:
-                print("  -> Payer PSP is up (HTTP 200).")
-            else:
-                print(f"  -> [WARN] /health returned {r.status}.")
+        status, _ = send("GET", f"{payer_psp.rstrip('/')}/health", kind="health")
+        if status == 200:
+            print("  -> Payer PSP is up (HTTP 200).")
+        else:
+            print(f"  -> [WARN] /health returned {status}.")
     except Exception as e:
         print(f"  -> [WARN] Payer PSP not reachable: {e}")
     print()
@@ -98,11 +106,10 @@ def main():
     if not os.path.isfile(SAMPLE_XML):
         print(f"  -> ERROR: File not found: {SAMPLE_XML}")
         sys.exit(1)
-    with open(SAMPLE_XML, "rb") as f:
-        body = f.read()
+    body = Path(SAMPLE_XML).read_bytes()
     n = len(body)
     print(f"  -> Loaded {n} bytes from {os.path.basename(SAMPLE_XML)}.")
-    params = _extract_reqvaladd_params(body)
+    params = sample_params(SAMPLE_XML, body, _extract_reqvaladd_params, _PARAMS_VERSION)
     if params:
         print("  -> Request parameters (from sample):")
         for k, v in params.items():
@@ -111,31 +118,27 @@ def main():
     print()
 
     # --- Step 3: POST ---
-    url = f"{PAYER_PSP.rstrip('/')}/api/reqvaladd"
+    url = f"{payer_psp.rstrip('/')}/api/reqvaladd"
     print("[Step 3/4] Sending POST /api/reqvaladd to Payer PSP...")
-    req = urllib.request.Request(url, data=body, method="POST")
-    req.add_header("Content-Type", "application/xml")
     try:
-        with urllib.request.urlopen(req, timeout=10) as r:
-            data = r.read()
-            status = r.status
-        print(f"  -> Response: HTTP {status}.")
-    except urllib.error.HTTPError as e:
-        data = e.read()
-        status = e.code
+        status, data = send("POST", url, body, {"Content-Type": "application/xml"})
+    except (OSError, http.client.HTTPException) as e:
+        print(f"  -> Request failed: {e}")
+        print(f"  -> Tried: {url}")
+        print("  1. Start: docker compose up -d npci payee_psp payer_psp")
+        print("  2. Override: PAYER_PSP_URL=http://localhost:5060 python scripts/test_reqvaladd.py")
+        sys.exit(1)
+    # Decode the body once; every message below prints this text
+    text = data.decode("utf-8", errors="replace")
+    if status >= 400:
         print(f"  -> HTTP {status}")
-        print(data.decode("utf-8", errors="replace"))
+        print(text)
         if status == 404:
             print("\n  If you see 404: rebuild and restart:")
             print("    docker compose build npci payee_psp payer_psp")
             print("    docker compose up -d npci payee_psp payer_psp")
         sys.exit(1)
-    except urllib.error.URLError as e:
-        print(f"  -> Request failed: {e}")
-        print(f"  -> Tried: {url}")
-        print("  1. Start: docker compose up -d npci payee_psp payer_psp")
-        print("  2. Override: PAYER_PSP_URL=http://localhost:5060 python scripts/test_reqvaladd.py")
-        sys.exit(1)
+    print(f"  -> Response: HTTP {status}.")
     print()
 
     # --- Step 4: Validate response ---
@@ -143,10 +146,9 @@ def main():
     if status != 200:
         print(f"  -> FAIL: expected HTTP 200, got {status}.")
         print("  -> Response body:")
-        print(data.decode("utf-8", errors="replace"))
+        print(text)
         sys.exit(1)
-    text = data.decode("utf-8", errors="replace")
-    if "RespValAdd" not in text or "result=" not in text:
+    if b"RespValAdd" not in data or b"result=" not in data:
         print("  -> FAIL: expected RespValAdd XML with 'result' attribute.")
         print("  -> Response body:", text)
         sys.exit(1)
@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
+import atexit
 import os
 import sys
-import xml.etree.ElementTree as ET
 from datetime import datetime
-import urllib.request
-import urllib.error
 import sqlite3
+from xml.sax.saxutils import escape
 import time
 
+from _http_util import send
+
 # Configuration
 NS = "http://npci.org/upi/schema/"
 PAYER_PSP_URL = "http://localhost:5060"
@@ -18,94 +19,127 @@ BENE_DB = "bene_bank.sqlite" if os.path.exists("bene_bank.sqlite") else "bene_ba
 PAYER_VPA = "abhishek@paytm"
 PAYEE_VPA = "abhishek@phonepe"
 
-def _qname(tag: str) -> str:
-    return f"{{{NS}}}{tag}"
+# Fixed-shape ReqPay; same document build_reqpay_xml used to assemble with ElementTree
+_REQPAY_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    f'<ns0:ReqPay xmlns:ns0="{NS}">'
+    '<ns0:Head ver="2.0" ts="{ts}" orgId="PAYER_PSP" msgId="{msg_id}" prodType="UPI" />'
+    '<ns0:Txn id="{txn_id}" type="PAY" />'
+    '<ns0:Payer addr="{payer}">'
+    '<ns0:Creds><ns0:Cred type="PIN"><ns0:Data>{pin}</ns0:Data></ns0:Cred></ns0:Creds>'
+    '<ns0:Amount value="{amount:.2f}" curr="INR" />'
+    '</ns0:Payer>'
+    '<ns0:Payees><ns0:Payee addr="{payee}" /></ns0:Payees>'
+    '</ns0:ReqPay>'
+)
+
+def _attr(value: str) -> str:
+    """Escape a value for a double-quoted XML attribute."""
+    return escape(value, {'"': "&quot;"})
+
+# One autocommit connection per DB file, reused by every get_balance call; get_both_balances
+# keeps its connection (both files attached) under _BOTH_DBS
+_CONN_CACHE: dict[str, sqlite3.Connection] = {}
+_BOTH_DBS = "rem+bene"
+
+@atexit.register
+def _close_connections():
+    for conn in _CONN_CACHE.values():
+        conn.close()
+    _CONN_CACHE.clear()
 
 def get_balance(db_path, vpa):
     if not os.path.exists(db_path):
         return None
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT balance FROM accounts WHERE vpa = ?", (vpa,))
-        row = cursor.fetchone()
-        conn.close()
+        conn = _CONN_CACHE.get(db_path)
+        if conn is None:
+            conn = _CONN_CACHE[db_path] = sqlite3.connect(db_path, isolation_level=None)
+        row = conn.execute("SELECT balance FROM accounts WHERE vpa = ?", (vpa,)).fetchone()
         return row[0] if row else None
     except Exception as e:
         print(f"Error reading {db_path}: {e}")
+        # Reconnect on the next call rather than reusing a broken handle
+        conn = _CONN_CACHE.pop(db_path, None)
+        if conn is not None:
+            conn.close()
         return None
 
+def get_both_balances(payer_vpa, payee_vpa):
+    """Payer (rem_bank) and payee (bene_bank) balances in one query over one connection."""
+    if not (os.path.exists(REM_DB) and os.path.exists(BENE_DB)):
+        return get_balance(REM_DB, payer_vpa), get_balance(BENE_DB, payee_vpa)
+    try:
+        conn = _CONN_CACHE.get(_BOTH_DBS)
+        if conn is None:
+            conn = sqlite3.connect(":memory:", isolation_level=None)
+            conn.execute("ATTACH DATABASE ? AS rem", (REM_DB,))
+            conn.execute("ATTACH DATABASE ? AS bene", (BENE_DB,))
+            _CONN_CACHE[_BOTH_DBS] = conn
+        return conn.execute(
+            "SELECT (SELECT balance FROM rem.accounts WHERE vpa = ?), "
+            "(SELECT balance FROM bene.accounts WHERE vpa = ?)",
+            (payer_vpa, payee_vpa),
+        ).fetchone()
+    except Exception as e:
+        print(f"Error reading balances: {e}")
+        conn = _CONN_CACHE.pop(_BOTH_DBS, None)
+        if conn is not None:
+            conn.close()
+        return None, None
+
 def build_reqpay_xml(payer_vpa: str, payee_vpa: str, amount: float, pin: str = "1234") -> bytes:
-    ts = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    txn_id = f"TXN{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-    msg_id = f"MSG{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+    # One clock read so ts, txn_id and msg_id always agree
+    now = datetime.utcnow()
+    ts = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    stamp = now.strftime("%Y%m%d%H%M%S")
+    txn_id = f"TXN{stamp}"
+    msg_id = f"MSG{stamp}"
     
-    root = ET.Element(_qname("ReqPay"))
-    head = ET.SubElement(root, _qname("Head"))
-    head.set("ver", "2.0")
-    head.set("ts", ts)
-    head.set("orgId", "PAYER_PSP")
-    head.set("msgId", msg_id)
-    head.set("prodType", "UPI")
-    
-    txn = ET.SubElement(root, _qname("Txn"))
-    txn.set("id", txn_id)
-    txn.set("type", "PAY")
-    
-    payer = ET.SubElement(root, _qname("Payer"))
-    payer.set("addr", payer_vpa)
-    creds = ET.SubElement(payer, _qname("Creds"))
-    cred = ET.SubElement(creds, _qname("Cred"))
-    cred.set("type", "PIN")
-    data = ET.SubElement(cred, _qname("Data"))
-    data.text = pin
-    
-    amt_el = ET.SubElement(payer, _qname("Amount"))
-    amt_el.set("value", f"{amount:.2f}")
-    amt_el.set("curr", "INR")
-    
-    payees = ET.SubElement(root, _qname("Payees"))
-    payee = ET.SubElement(payees, _qname("Payee"))
-    payee.set("addr", payee_vpa)
-    
-    xml_str = ET.tostring(root, encoding="unicode", method="xml")
-    return ('<?xml version="1.0" encoding="UTF-8"?>\n' + xml_str).encode("utf-8")
+    return _REQPAY_TEMPLATE.format(
+        ts=ts,
+        msg_id=msg_id,
+        txn_id=txn_id,
+        payer=_attr(payer_vpa),
+        pin=escape(pin),
+        amount=amount,
+        payee=_attr(payee_vpa),
+    ).encode("utf-8")
 
 def run_test(amount):
     print(f"\n--- Testing Transaction with Amount: ₹{amount:.2f} ---")
     
     # 1. Initial Balances
-    p_initial = get_balance(REM_DB, PAYER_VPA)
-    b_initial = get_balance(BENE_DB, PAYEE_VPA)
+    p_initial, b_initial = get_both_balances(PAYER_VPA, PAYEE_VPA)
     print(f"Initial Balances: Payer={p_initial}, Payee={b_initial}")
     
     # 2. Send Transaction
     url = f"{PAYER_PSP_URL}/api/reqpay"
     xml_body = build_reqpay_xml(PAYER_VPA, PAYEE_VPA, amount)
     
-    req = urllib.request.Request(url, data=xml_body, method="POST")
-    req.add_header("Content-Type", "application/xml")
-    
     try:
         print("Sending ReqPay to Payer PSP...")
-        with urllib.request.urlopen(req, timeout=10) as r:
-            status = r.status
-            print(f"Payer PSP Response Code: {status}")
-    except urllib.error.HTTPError as e:
-        print(f"Payer PSP Error: {e.code}")
-        print(e.read().decode())
-        return
+        status, data = send("POST", url, xml_body, {"Content-Type": "application/xml"})
     except Exception as e:
         print(f"Connection Error: {e}")
         return
+    if status >= 400:
+        print(f"Payer PSP Error: {status}")
+        print(data.decode())
+        return
+    print(f"Payer PSP Response Code: {status}")
 
-    # 3. Wait for async processing
-    print("Waiting 3 seconds for transaction to clear...")
-    time.sleep(3)
+    # 3. Wait for async processing: poll until both sides have settled, up to 3 seconds
+    print("Waiting up to 3 seconds for transaction to clear...")
+    deadline = time.monotonic() + 3.0
+    while True:
+        p_final, b_final = get_both_balances(PAYER_VPA, PAYEE_VPA)
+        # Debit lands before credit, so wait for both; a rejection never moves either
+        if (p_final != p_initial and b_final != b_initial) or time.monotonic() >= deadline:
+            break
+        time.sleep(0.05)
     
     # 4. Final Balances
-    p_final = get_balance(REM_DB, PAYER_VPA)
-    b_final = get_balance(BENE_DB, PAYEE_VPA)
     print(f"Final Balances:   Payer={p_final}, Payee={b_final}")
     
     # 5. Result
@@ -0,0 +1,36 @@
+"""
+Helpers shared by the Flask services (payer_psp, rem_bank, payment_ui).
+Lives at the repo root like manifest.py: on PYTHONPATH under docker compose, copied next to app.py in the images.
+"""
+import os
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson for jsonify and request.json."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def xsd_path(app_file: str, filename: str) -> str:
+    """Path to a schema for the service whose app module is app_file: its own schemas/ first, then common/schemas/."""
+    base = os.path.dirname(os.path.abspath(app_file))
+    for rel in (f"schemas/{filename}", f"../common/schemas/{filename}"):
+        p = os.path.normpath(os.path.join(base, rel))
+        if os.path.isfile(p):
+            return p
+    return os.path.join(base, "schemas", filename)
+
+
+_XML_ATTR_TRANS = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", "'": "&apos;", '"': "&quot;"})
+
+
+def escape_attr(s: str) -> str:
+    """Escape string for use in an XML attribute value (per XML 1.0)."""
+    return s.translate(_XML_ATTR_TRANS) if s else s